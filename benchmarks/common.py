@@ -0,0 +1,43 @@
+"""
+Shared setup of the benchmarks: every benchmark runs in a temporary working directory (so `DATA_DIR` and the caches
+start empty) against the local fake providers, configured through the environment before `marketing_sm` reads its
+settings.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marketing_sm.infrastructure.fakes import FakeProvidersServer  # noqa: E402
+
+
+def add_fake_arguments(parser):
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--time-to-first-token", type=float, default=1.0)
+    parser.add_argument("--image-latency", type=float, default=0.5)
+    parser.add_argument("--image-jitter", type=float, default=0.0)
+    parser.add_argument("--image-error-rate", type=float, default=0.0)
+
+
+def start_fake_environment(args, **environment) -> FakeProvidersServer:
+    os.chdir(tempfile.mkdtemp(prefix="marketing-sm-bench-"))
+    server = FakeProvidersServer(
+        port=0,
+        latency=args.image_latency,
+        jitter=args.image_jitter,
+        error_rate=args.image_error_rate,
+    ).start()
+    os.environ.update(
+        TEXT_BACKEND="fake",
+        FAKE_TEXT_TOKENS_PER_SECOND=str(args.tokens_per_second),
+        FAKE_TEXT_TIME_TO_FIRST_TOKEN=str(args.time_to_first_token),
+        # Measure the pipeline, not the quota of the real model
+        TEXT_REQUESTS_PER_MINUTE="0",
+        IMAGE_PROVIDER_URL=f"{server.url}/prompt",
+        SCRAPER_PROVIDER="local",
+        LOCAL_PROVIDER_URL=server.url,
+        **environment,
+    )
+    return server
@@ -0,0 +1,95 @@
+"""
+Profiles a single `TextGenerationPipeline.iter_posts` run against the local fake providers, without any cloud project.
+
+The text is produced by `FakeTextBackend` and the images by `FakeProvidersServer`, both with configurable timings. The
+run is done in a temporary working directory, so the image and response caches start empty, and reports:
+
+- the time to the first streamed chunk and the duration of the stream;
+- the time at which every post was parsed;
+- the time at which all images were available.
+
+Usage:
+
+    python benchmarks/create_posts.py --posts 12 --tokens-per-second 50 --time-to-first-token 1 --image-latency 0.5
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import wait
+
+from common import add_fake_arguments, start_fake_environment
+
+
+class TimedBackend:
+    def __init__(self, backend, start):
+        self._backend = backend
+        self._start = start
+        self.first_chunk = None
+        self.stream_end = None
+
+    @property
+    def cache_params(self):
+        return self._backend.cache_params
+
+    def stream(self, message, generation_config):
+        for chunk in self._backend.stream(message, generation_config):
+            if self.first_chunk is None:
+                self.first_chunk = time.perf_counter() - self._start
+            yield chunk
+        self.stream_end = time.perf_counter() - self._start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=12)
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_fake_environment(args)
+
+    from marketing_sm.business.ai import TextGenerationPipeline
+
+    pipeline = TextGenerationPipeline()
+    start = time.perf_counter()
+    pipeline._backend = TimedBackend(pipeline._backend, start)
+
+    posts_parsed = []
+    image_futures = []
+    for _, futures in pipeline.iter_posts(
+        business="Benchmark",
+        business_examples="",
+        business_description="A synthetic business used for benchmarks",
+        suggestions="",
+        month="Janeiro",
+        total_posts=args.posts,
+        edu_posts=args.posts,
+        mot_posts=0,
+        int_posts=0,
+        sell_posts=0,
+        colors=["#0000ff", "#ffffff"],
+        use_cache=False,
+    ):
+        posts_parsed.append(time.perf_counter() - start)
+        image_futures += futures
+    wait(image_futures)
+    images_done = time.perf_counter() - start
+    server.stop()
+
+    print(
+        json.dumps(
+            {
+                "time_to_first_chunk": pipeline._backend.first_chunk,
+                "stream_end": pipeline._backend.stream_end,
+                "posts_parsed": posts_parsed,
+                "images": len(image_futures),
+                "images_failed": sum(future.result() is None for future in image_futures),
+                "images_done": images_done,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+End-to-end benchmark of the post generation pipeline: `Interface._create_posts` -> `TextGenerationPipeline.iter_posts`
+-> image generation, run against the local fake providers (see `benchmarks/common.py`).
+
+Every combination of the requested post counts, images per post and state sizes is a scenario. For each scenario, a
+state with the given number of businesses (each with a synthetic scraped profile) is created, a warm-up run is done
+(which also indexes the profile used for examples), and then the measured runs are done with empty image and response
+caches. For every scenario the following are reported:
+
+- p50 / p95 latency of the whole run and of the first UI update;
+- throughput, in posts and images per second;
+- peak memory allocated by Python during the runs (tracemalloc) and the process maximum resident set size.
+
+The results are printed and saved as JSON (by default in `benchmarks/results/`), together with the commit they were
+measured on, so regressions can be compared across commits.
+
+Usage:
+
+    python benchmarks/pipeline.py --posts 1 4 8 12 --images-per-post 1 3 --businesses 1 100 --repeats 5
+
+Pass `--no-examples` to skip the retrieval of examples, which needs the embedding model to be available locally.
+"""
+
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from common import add_fake_arguments, start_fake_environment
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PROFILE_URL = "https://www.instagram.com/benchmark-{}/"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_state(businesses, profile_posts):
+    from marketing_sm.business.model import load_state
+    from marketing_sm.data.posts import ScrapedProfile
+    from marketing_sm.data.scraper import mapping_fun
+    from marketing_sm.infrastructure.fakes import synthetic_dataset
+
+    state = load_state()
+    for idx in range(businesses):
+        name = f"business-{idx}"
+        url = PROFILE_URL.format(idx)
+        state.add_business(name)
+        state.add_description(name, "default", f"Synthetic business number {idx}")
+        state.add_instagram(
+            name,
+            url,
+            ScrapedProfile.from_dicts([mapping_fun(item) for item in synthetic_dataset(url, profile_posts)]),
+        )
+    return state
+
+
+def run_once(interface, total_posts, profile_url):
+    start = time.perf_counter()
+    first_update = None
+    for _ in interface._create_posts(
+        "business-0",
+        profile_url,
+        "Synthetic business number 0",
+        "",
+        "Janeiro",
+        total_posts,
+        total_posts,
+        0,
+        0,
+        0,
+        True,
+        "#0000ff",
+        "#ffffff",
+        None,
+        None,
+        None,
+        None,
+    ):
+        if first_update is None:
+            first_update = time.perf_counter() - start
+    return first_update, time.perf_counter() - start
+
+
+def run_scenario(args, total_posts, images_per_post, businesses):
+    import gradio as gr
+
+    from marketing_sm.business import ai
+    from marketing_sm.data.cache import DiskCache
+    from marketing_sm.presentation.interface import Interface
+    from marketing_sm.presentation.language import PortugueseLanguage
+
+    state = build_state(businesses, args.profile_posts)
+    interface = Interface(gr, state, language=PortugueseLanguage())
+    interface.model._backend.backend.images_per_post = images_per_post
+    profile_url = "" if args.no_examples else PROFILE_URL.format(0)
+
+    for _ in range(args.warmup):
+        run_once(interface, total_posts, profile_url)
+
+    latencies, first_updates = [], []
+    tracemalloc.start()
+    for _ in range(args.repeats):
+        ai._image_cache = DiskCache(tempfile.mkdtemp(prefix="images-"), ai.settings.image_cache_max_bytes)
+        ai._thumbnail_cache = DiskCache(
+            tempfile.mkdtemp(prefix="thumbnails-"), ai.settings.thumbnail_cache_max_bytes, suffix=".jpg"
+        )
+        first_update, latency = run_once(interface, total_posts, profile_url)
+        first_updates.append(first_update)
+        latencies.append(latency)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    state.store.close()
+
+    total_time = sum(latencies)
+    return {
+        "posts": total_posts,
+        "images_per_post": images_per_post,
+        "businesses": businesses,
+        "repeats": args.repeats,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "first_update_p50": percentile(first_updates, 0.50),
+        "first_update_p95": percentile(first_updates, 0.95),
+        "posts_per_second": total_posts * args.repeats / total_time,
+        "images_per_second": total_posts * images_per_post * args.repeats / total_time,
+        "peak_traced_memory_bytes": peak_memory,
+        "max_rss_kilobytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, nargs="+", default=[1, 4, 8, 12])
+    parser.add_argument("--images-per-post", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--businesses", type=int, nargs="+", default=[1, 100])
+    parser.add_argument("--profile-posts", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--no-examples", action="store_true")
+    parser.add_argument("--output", default=None, help="Path of the JSON results file")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    timestamp = datetime.now(timezone.utc)
+    output = os.path.abspath(
+        args.output
+        or os.path.join(RESULTS_DIR, f"pipeline-{timestamp.strftime('%Y%m%dT%H%M%SZ')}.json")
+    )
+    commit = git_commit()
+    server = start_fake_environment(args)
+    base_directory = os.getcwd()
+
+    scenarios = []
+    for businesses in args.businesses:
+        for images_per_post in args.images_per_post:
+            for total_posts in args.posts:
+                os.chdir(tempfile.mkdtemp(dir=base_directory))
+                result = run_scenario(args, total_posts, images_per_post, businesses)
+                print(json.dumps(result), file=sys.stderr)
+                scenarios.append(result)
+    server.stop()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "benchmark": "pipeline",
+                "commit": commit,
+                "timestamp": timestamp.isoformat(),
+                "parameters": vars(args),
+                "scenarios": scenarios,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Results saved in {output}")
+
+
+if __name__ == "__main__":
+    main()
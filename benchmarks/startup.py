@@ -0,0 +1,168 @@
+"""
+Benchmarks the start-up of the application (`python -m marketing_sm.presentation.app`) against the local fake
+providers (see `benchmarks/common.py`).
+
+For every state size, a state with the given number of businesses is created and the application is started in a new
+process, on a free port, several times. For every start the following are measured:
+
+- the time until the server answers on `/metrics`, which is when a readiness probe would succeed;
+- the time until the background warm-up of the text generation pipeline and the examples index is done, read from the
+  `warm_up` stage of the metrics.
+
+The import time of `marketing_sm.presentation.interface` is measured too, in a fresh interpreter. The results are
+printed and saved as JSON (by default in `benchmarks/results/`), together with the commit they were measured on.
+
+Usage:
+
+    python benchmarks/startup.py --businesses 1 100 1000 --repeats 5
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+from common import add_fake_arguments, start_fake_environment
+from pipeline import RESULTS_DIR, build_state, git_commit, percentile
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WARM_UP_METRIC = 'marketing_sm_stage_seconds_count{stage="warm_up"}'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def environment(**variables):
+    env = dict(os.environ, **variables)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPOSITORY_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+def fetch_metrics(port):
+    try:
+        with urllib.request.urlopen(f"http://localhost:{port}/metrics", timeout=1) as response:
+            return response.read().decode("utf-8")
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+def wait_until(process, condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The application exited with code {process.returncode}")
+        if condition():
+            return
+        time.sleep(0.05)
+    raise TimeoutError(f"The application did not start in {timeout} seconds")
+
+
+def start_once(args):
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "marketing_sm.presentation.app"],
+        env=environment(SERVER_HOST="localhost", SERVER_PORT=str(port)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until(process, lambda: fetch_metrics(port) is not None, args.timeout)
+        ready = time.perf_counter() - start
+        wait_until(process, lambda: WARM_UP_METRIC in (fetch_metrics(port) or ""), args.timeout)
+        warm = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return ready, warm
+
+
+def import_time():
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "import marketing_sm.presentation.interface"],
+        env=environment(),
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def run_scenario(args, businesses):
+    state = build_state(businesses, args.profile_posts)
+    state.store.close()
+
+    ready_times, warm_times = [], []
+    for _ in range(args.repeats):
+        ready, warm = start_once(args)
+        ready_times.append(ready)
+        warm_times.append(warm)
+    return {
+        "businesses": businesses,
+        "repeats": args.repeats,
+        "ready_p50": percentile(ready_times, 0.50),
+        "ready_p95": percentile(ready_times, 0.95),
+        "warm_p50": percentile(warm_times, 0.50),
+        "warm_p95": percentile(warm_times, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--businesses", type=int, nargs="+", default=[1, 100])
+    parser.add_argument("--profile-posts", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for every start")
+    parser.add_argument("--output", default=None, help="Path of the JSON results file")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    timestamp = datetime.now(timezone.utc)
+    output = os.path.abspath(
+        args.output
+        or os.path.join(RESULTS_DIR, f"startup-{timestamp.strftime('%Y%m%dT%H%M%SZ')}.json")
+    )
+    commit = git_commit()
+    server = start_fake_environment(args)
+    base_directory = os.getcwd()
+
+    imports = [import_time() for _ in range(args.repeats)]
+    print(json.dumps({"import_p50": percentile(imports, 0.50)}), file=sys.stderr)
+
+    scenarios = []
+    for businesses in args.businesses:
+        os.chdir(tempfile.mkdtemp(dir=base_directory))
+        result = run_scenario(args, businesses)
+        print(json.dumps(result), file=sys.stderr)
+        scenarios.append(result)
+    server.stop()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "benchmark": "startup",
+                "commit": commit,
+                "timestamp": timestamp.isoformat(),
+                "parameters": vars(args),
+                "import_p50": percentile(imports, 0.50),
+                "import_p95": percentile(imports, 0.95),
+                "scenarios": scenarios,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Results saved in {output}")
+
+
+if __name__ == "__main__":
+    main()
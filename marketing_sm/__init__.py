@@ -1 +0,0 @@
-import marketing_sm.presentation.app as app
@@ -4,34 +4,71 @@ This module defines a system for generating and enhancing social media posts usi
 ### Components
 
 1. **Imports**:
-   - `requests`: Used for making HTTP requests to the external image generation service.
-   - `vertexai`: The Vertex AI library for interacting with Google's AI models.
    - `logging`: Provides logging functionality for debugging and tracking.
    - `io`: Used for handling byte streams of images.
-   - `PIL.Image`: Provides image processing capabilities.
+   - `PIL.Image`: Provides image processing capabilities, used to make the thumbnails.
    - `marketing_sm.data.prompts`: Imports system and user messages, and output parser definitions.
 
 2. **Functions**:
+   - `fetch_image(image_description)`:
+     - **Purpose**: Requests a single image from the configured `ImageProvider` (see `marketing_sm.data.images`), which
+       limits the concurrency of the requests and retries the throttled ones.
+       The encoded response is kept as is in a content-addressed `DiskCache` under `DATA_DIR`, keyed by the normalized
+       prompt and the provider parameters, so repeated prompts are served from disk. A JPEG thumbnail of at most
+       `image_thumbnail_size` pixels is made once per image and kept in a second cache. Images are never kept decoded
+       in memory.
+     - **Returns**: A `GeneratedImage` with the paths of the original file and of its thumbnail, or `None` if the
+       request failed.
+   - `submit_images(post)` / `collect_images(futures)`:
+     - **Purpose**: Schedule the images of a single post on the shared thread pool and wait for them, dropping the failed ones.
+   - `plan_fan_out(counts, posts_per_request)`:
+     - **Purpose**: Splits the number of posts of every category into parts of at most `posts_per_request` posts, as
+       even as possible, each to be generated by its own request.
+   - `fan_out_periods(parts)`:
+     - **Purpose**: Splits the month into consecutive, disjoint ranges of days among the parts of each category.
    - `generate_images(posts)`:
      - **Purpose**: Fetches images based on descriptions provided in social media posts and updates the posts with these images.
+       All images are requested concurrently on a shared thread pool limited to `image_concurrency` workers, and
+       the results are stored back in the original post/image order.
      - **Parameters**:
        - `posts`: A dictionary containing the posts, each with a 'prompt_image' field that holds image descriptions.
-     - **Returns**: The `posts` dictionary updated with images fetched from the external image generation service.
+     - **Returns**: The `posts` dictionary updated with the `GeneratedImage` of every image.
 
-3. **Class `Model`**:
+3. **Class `TextGenerationPipeline`**:
    - **Purpose**: Initializes and utilizes a generative model to create content for social media posts. It also handles the integration with an external image generation service.
 
    - **Initialization**:
-     - `self._model`: An instance of `GenerativeModel` from Vertex AI, configured with a specific model name and system instruction.
+     - `self._backend`: The `TextBackend` selected with the `text_backend` setting (see `marketing_sm.data.text`): Gemini on Vertex AI, or a local fake for benchmarks.
      - `self._generation_config`: Configuration settings for content generation, including token limits and sampling methods.
-     - `self._safety_settings`: Safety configurations to block harmful content categories.
 
    - **Methods**:
-     - `__init__()`: Initializes the `Model` class with a generative model, generation configurations, and safety settings.
+     - `__init__()`: Initializes the `TextGenerationPipeline` class with a text backend, generation configurations and the response cache.
+       The backend is rate limited (see `marketing_sm.data.text`), which does not apply to the responses replayed from the cache.
+
+     - `iter_posts(business, business_examples, business_description, suggestions, month, total_posts, edu_posts, mot_posts, int_posts, sell_posts, colors, use_cache=True)`:
+       - **Purpose**: Streams the model response through an `IncrementalPostsParser` and yields every post, together with its
+         pending image futures, as soon as the post's JSON object is closed. Image generation therefore overlaps with the
+         rest of the text generation.
+       - The examples are compacted and truncated to `examples_token_budget` tokens before being rendered in the message.
+       - The duration of every stage (prompt rendering, streaming, parsing, image requests) and the
+         estimated tokens are recorded in `marketing_sm.infrastructure.metrics`. The limiter wait and the time to first
+         token of the requests are recorded by the text backend (see `marketing_sm.data.text`).
+       - Complete responses are kept in a persistent `DiskCache` keyed by the model, system instruction, generation config
+         and rendered user message. Identical requests are replayed from it unless `use_cache` is `False`, in which case a
+         fresh response is generated and replaces the cached one.
+       - With the `text_fan_out` setting, the month is split by `plan_fan_out` into sub-requests of at most
+         `text_fan_out_posts` posts of a single category, which are run concurrently on a shared thread pool. Every
+         sub-request has the same business context plus a `FAN_OUT_HINT`: the parts of the same category are given
+         disjoint periods of the month (see `fan_out_periods`) to draw their topics from, and every part is told the
+         categories and periods of the others, so that they do not repeat each other. Their posts are yielded in the order of the parts, the first part as it is
+         streamed, so the whole month takes about as long as its largest part instead of the sum of all of them.
+         When the consumer closes the generator or a part fails, the other parts are cancelled: their response streams
+         are closed between chunks (without caching the partial responses) and the images of their buffered posts are
+         cancelled.
 
      - `create_posts(business, business_examples, business_description, suggestions, month, total_posts, edu_posts, mot_posts, int_posts, sell_posts, colors)`:
-       - **Purpose**: Generates social media posts based on input parameters, including business details, post suggestions, and other configurations. It then retrieves images for the posts and returns the final content.
-       - **Parameters**:
+       - **Purpose**: Generates social media posts based on input parameters, including business details, post suggestions, and other configurations. It consumes `iter_posts()` and waits for the images of every post before returning the final content.
+       - **Parameters** (keyword only):
          - `business`: The name of the business.
          - `business_examples`: Examples related to the business.
          - `business_description`: A description of the business.
@@ -45,70 +82,201 @@ This module defines a system for generating and enhancing social media posts usi
 ### Example Usage
 
 To use this module:
-1. Initialize the `Model` class.
+1. Initialize the `TextGenerationPipeline` class.
 2. Call `create_posts()` with the appropriate parameters to generate social media posts.
 3. The resulting posts will include content generated by Vertex AI and images fetched from the external service.
 
 This code ensures that social media content is created with high-quality text and relevant images, enhancing the engagement of social media posts.
 """
 
-import requests
-import vertexai
 import logging
 import io
-
-from vertexai.generative_models import GenerativeModel
-import vertexai.preview.generative_models as generative_models
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 
 from PIL import Image
 
-from marketing_sm.data.prompts import SYSTEM_MESSAGE, USER_MESSAGE, OUTPUT_PARSER
-from marketing_sm.infrastructure.settings import Settings
-
-settings = Settings()
+from marketing_sm.business.compaction import compact_examples, estimate_tokens
+from marketing_sm.data.cache import DiskCache
+from marketing_sm.data.constants import (
+    DATA_DIR,
+    IMAGE_CACHE_DIR,
+    TEXT_CACHE_DIR,
+    THUMBNAIL_CACHE_DIR,
+)
+from marketing_sm.data.images import create_image_provider
+from marketing_sm.data.parser import IncrementalPostsParser
+from marketing_sm.data.prompts import (
+    CATEGORY_LABELS,
+    FAN_OUT_HINT,
+    OUTPUT_PARSER,
+    SYSTEM_MESSAGE,
+    USER_MESSAGE,
+)
+from marketing_sm.data.text import create_text_backend
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.settings import get_settings
 
-vertexai.init(project=settings.google_api_project, location=settings.google_location)
+settings = get_settings()
 
 logger = logging.getLogger()
 
+_image_executor = ThreadPoolExecutor(
+    max_workers=settings.image_concurrency, thread_name_prefix="image"
+)
+_text_executor = ThreadPoolExecutor(
+    max_workers=settings.text_concurrency, thread_name_prefix="text"
+)
+_DONE = object()
+DAYS_PER_MONTH = 30
+
+_image_provider = create_image_provider(settings)
+_image_cache = DiskCache(
+    os.path.join(DATA_DIR, IMAGE_CACHE_DIR), settings.image_cache_max_bytes
+)
+metrics.register_cache("images", _image_cache)
+_thumbnail_cache = DiskCache(
+    os.path.join(DATA_DIR, THUMBNAIL_CACHE_DIR),
+    settings.thumbnail_cache_max_bytes,
+    suffix=".jpg",
+)
+metrics.register_cache("thumbnails", _thumbnail_cache)
+
+
+@dataclass(frozen=True)
+class GeneratedImage:
+    path: str
+    thumbnail: str
+
+
+def image_cache_key(image_description):
+    prompt = " ".join(image_description.split()).lower()
+    return DiskCache.make_key(*_image_provider.cache_params, prompt)
+
+
+def make_thumbnail(source, size: int) -> bytes:
+    buffer = io.BytesIO()
+    with Image.open(source) as image:
+        # Let the JPEG decoder downscale while decoding instead of decoding the full bitmap
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size))
+        image.convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def fetch_image(image_description) -> Optional[GeneratedImage]:
+    key = image_cache_key(image_description)
+    path = _image_cache.get_path(key)
+    content = None
+    if path is None:
+        with metrics.timed("image_request"):
+            content = _image_provider.generate(image_description)
+        if content is None:
+            return None
+        metrics.IMAGE_BYTES.inc(len(content))
+
+    thumbnail_key = DiskCache.make_key(key, settings.image_thumbnail_size)
+    thumbnail = _thumbnail_cache.get_path(thumbnail_key)
+    if thumbnail is None:
+        try:
+            with metrics.timed("thumbnail"):
+                data = make_thumbnail(
+                    io.BytesIO(content) if content is not None else path,
+                    settings.image_thumbnail_size,
+                )
+        except OSError as e:
+            logger.warning(f"Invalid image for prompt {image_description}: {e}")
+            return None
+    try:
+        if thumbnail is None:
+            thumbnail = _thumbnail_cache.put(thumbnail_key, data)
+        if path is None:
+            path = _image_cache.put(key, content)
+    except OSError as e:
+        logger.warning(f"Could not cache the image for prompt {image_description}: {e}")
+        return None
+    return GeneratedImage(path, thumbnail)
+
+
+def submit_images(post):
+    return [
+        _image_executor.submit(fetch_image, image_description)
+        for image_description in post["prompt_image"]
+    ]
+
+
+def collect_images(futures):
+    images = [future.result() for future in futures]
+    return [image for image in images if image is not None]
+
 
 def generate_images(posts):
-    for idx, post in enumerate(posts["posts"]):
-        images = []
-        for image_description in post["prompt_image"]:
-            response = requests.post(
-                f"https://pollinations.ai/prompt/{image_description}"
-            )
-            if response.status_code == 200:
-                image = Image.open(io.BytesIO(response.content))
-                images.append(image)
-        posts["posts"][idx]["images"] = images
+    futures = [submit_images(post) for post in posts["posts"]]
+    for idx, post_futures in enumerate(futures):
+        posts["posts"][idx]["images"] = collect_images(post_futures)
     return posts
 
 
+def plan_fan_out(counts: Dict[str, int], posts_per_request: int) -> List[Dict[str, int]]:
+    if posts_per_request < 1:
+        raise ValueError(f"Every request must generate at least 1 post, not {posts_per_request}")
+    parts = []
+    for category, count in counts.items():
+        requests = math.ceil(count / posts_per_request)
+        for idx in range(requests):
+            size = count // requests + (1 if idx < count % requests else 0)
+            parts.append({**dict.fromkeys(counts, 0), category: size})
+    return parts or [counts]
+
+
+def month_period(idx: int, parts: int) -> str:
+    if parts == 1:
+        return "the whole month"
+    first = 1 + idx * DAYS_PER_MONTH // parts
+    if idx == parts - 1:
+        return f"days {first} to the end of the month"
+    return f"days {first} to {(idx + 1) * DAYS_PER_MONTH // parts}"
+
+
+def fan_out_periods(parts: List[Dict[str, int]]) -> List[str]:
+    categories = [next((category for category, count in part.items() if count), None) for part in parts]
+    periods = []
+    for idx, category in enumerate(categories):
+        periods.append(month_period(categories[:idx].count(category), categories.count(category)))
+    return periods
+
+
+def describe_posts(counts: Dict[str, int]) -> str:
+    return ", ".join(
+        f"{count} {CATEGORY_LABELS[category]}" for category, count in counts.items() if count
+    )
+
+
 class TextGenerationPipeline:
     def __init__(self):
-        self._model = GenerativeModel(
-            settings.google_text_model,
-            system_instruction=[
-                SYSTEM_MESSAGE.format(
-                    format_instructions=OUTPUT_PARSER.get_format_instructions()
-                )
-            ],
+        self._system_instruction = SYSTEM_MESSAGE.format(
+            format_instructions=OUTPUT_PARSER.get_format_instructions()
         )
+        self._backend = create_text_backend(settings, self._system_instruction)
         self._generation_config = {
             "max_output_tokens": 8192,
             "temperature": 1,
             "top_p": 0.95,
         }
-        self._safety_settings = {
-            generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-            generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-            generative_models.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-            generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-        }
+        self._response_cache = DiskCache(
+            os.path.join(DATA_DIR, TEXT_CACHE_DIR),
+            settings.text_cache_max_bytes,
+            ttl=settings.text_cache_ttl_seconds,
+        )
+        metrics.register_cache("responses", self._response_cache)
 
-    def create_posts(
+    def iter_posts(
             self,
             business,
             business_examples,
@@ -121,36 +289,146 @@ class TextGenerationPipeline:
             int_posts,
             sell_posts,
             colors,
+            use_cache=True,
     ):
-        message = USER_MESSAGE.format(
-            business=business,
-            business_description=business_description,
-            business_examples=business_examples,
-            total_posts=total_posts,
-            month=month,
-            edu_posts=edu_posts,
-            int_posts=int_posts,
-            mot_posts=mot_posts,
-            sell_posts=sell_posts,
-            suggestions=suggestions,
-            colors=colors,
-        )
+        counts = {
+            "edu_posts": edu_posts,
+            "int_posts": int_posts,
+            "sell_posts": sell_posts,
+            "mot_posts": mot_posts,
+        }
+        parts = plan_fan_out(counts, settings.text_fan_out_posts) if settings.text_fan_out else [counts]
+        with metrics.timed("render_prompt"):
+            context = {
+                "business": business,
+                "business_description": business_description,
+                "business_examples": compact_examples(
+                    business_examples, settings.examples_token_budget
+                ),
+                "month": month,
+                "suggestions": suggestions,
+                "colors": colors,
+            }
+            if len(parts) == 1:
+                messages = [USER_MESSAGE.format(**context, total_posts=total_posts, **counts)]
+            else:
+                periods = fan_out_periods(parts)
+                messages = [
+                    USER_MESSAGE.format(**context, total_posts=sum(part.values()), **part)
+                    + FAN_OUT_HINT.format(
+                        part=idx + 1,
+                        parts=len(parts),
+                        month=month,
+                        period=periods[idx],
+                        covered_topics="; ".join(
+                            f"part {other + 1}: {describe_posts(other_part)} posts for {periods[other]}"
+                            for other, other_part in enumerate(parts)
+                            if other != idx
+                        ),
+                    )
+                    for idx, part in enumerate(parts)
+                ]
+
+        if len(messages) == 1:
+            yield from self._iter_request(messages[0], use_cache)
+        else:
+            logger.info(f"Generating the posts of {month} in {len(messages)} concurrent requests")
+            yield from self._iter_fan_out(messages, use_cache)
+
+    def _iter_fan_out(self, messages, use_cache):
+        cancelled = threading.Event()
+        queues = []
+        for message in messages:
+            posts_queue = queue.Queue()
+            _text_executor.submit(self._fill_queue, posts_queue, message, use_cache, cancelled)
+            queues.append(posts_queue)
 
-        logger.info(f"System Message: {self._model._system_instruction}")
+        # The parts are merged in order; the first one is yielded as it is streamed, the others are buffered meanwhile
+        try:
+            for posts_queue in queues:
+                while True:
+                    item = posts_queue.get()
+                    if item is _DONE:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+        finally:
+            # The consumer stopped early or a part failed: stop the other parts and the images of their buffered posts
+            cancelled.set()
+            for posts_queue in queues:
+                while not posts_queue.empty():
+                    item = posts_queue.get_nowait()
+                    if isinstance(item, tuple):
+                        for future in item[1]:
+                            future.cancel()
+
+    def _fill_queue(self, posts_queue, message, use_cache, cancelled):
+        if cancelled.is_set():
+            posts_queue.put(_DONE)
+            return
+        try:
+            for item in self._iter_request(message, use_cache, cancelled):
+                posts_queue.put(item)
+        except Exception as e:
+            posts_queue.put(e)
+        posts_queue.put(_DONE)
+
+    def _iter_request(self, message, use_cache, cancelled=None):
+        prompt_tokens = estimate_tokens(message)
+
+        logger.info(f"System Message: {self._system_instruction}")
         logger.info(f"User Message: {message}")
+        logger.info(f"Estimated user message tokens: {prompt_tokens}")
 
-        responses = self._model.generate_content(
-            [message],
-            generation_config=self._generation_config,
-            safety_settings=self._safety_settings,
-            stream=True,
+        cache_key = DiskCache.make_key(
+            *self._backend.cache_params,
+            self._system_instruction,
+            self._generation_config,
+            message,
         )
+        cached = self._response_cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            logger.info(f"Using cached response {cache_key}")
+            chunks = [cached.decode("utf-8")]
+        else:
+            metrics.TOKENS.inc(prompt_tokens, kind="prompt")
+            chunks = self._backend.stream(message, self._generation_config)
+
+        parser = IncrementalPostsParser()
+        parse_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            for chunk in chunks:
+                if cancelled is not None and cancelled.is_set():
+                    # The partial response is not cached
+                    logger.info("Generation cancelled, closing the response stream")
+                    return
+                parse_start = time.perf_counter()
+                posts = parser.feed(chunk)
+                parse_seconds += time.perf_counter() - parse_start
+                for post in posts:
+                    yield post, submit_images(post)
+        finally:
+            if hasattr(chunks, "close"):
+                # Releases the limiter slot of an interrupted stream
+                chunks.close()
 
-        results = ""
-        for response in responses:
-            results += response.candidates[0].text
+        if not parser.posts_found:
+            logger.warning("No posts were parsed from the stream, parsing the full response instead")
+            with metrics.timed("parse_full_response"):
+                posts = OUTPUT_PARSER.parse(parser.text)["posts"]
+            for post in posts:
+                yield post, submit_images(post)
 
-        posts = OUTPUT_PARSER.parse(results)
+        if cached is None:
+            metrics.observe("parse", parse_seconds)
+            metrics.observe("stream", time.perf_counter() - start)
+            metrics.TOKENS.inc(estimate_tokens(parser.text), kind="completion")
+            self._response_cache.put(cache_key, parser.text.encode("utf-8"))
 
-        posts_with_images = generate_images(posts)
-        return posts_with_images
+    def create_posts(self, **kwargs):
+        posts = list(self.iter_posts(**kwargs))
+        for post, image_futures in posts:
+            post["images"] = collect_images(image_futures)
+        return {"posts": [post for post, _ in posts]}
@@ -0,0 +1,58 @@
+"""
+This module compacts the examples of previous posts before they are rendered into `USER_MESSAGE`, keeping the prompt
+within a configurable token budget.
+
+Each scraped post is reduced to the fields that are useful to the model: image URLs and empty values are removed,
+hashtags are deduplicated and the date is shortened. The posts are then added in the given order (most relevant first,
+see `marketing_sm.data.examples`), one compact JSON line each, as long as they fit in the token budget.
+
+Tokens are estimated locally with `estimate_tokens`, which counts words and punctuation and splits long words in
+chunks of four characters, a close enough approximation of the sub-word tokenizers used by the text models.
+"""
+
+import json
+import math
+import re
+from typing import Dict, List
+
+REMOVED_FIELDS = ("images",)
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(
+        max(1, math.ceil(len(piece) / CHARS_PER_TOKEN))
+        for piece in TOKEN_PATTERN.findall(text)
+    )
+
+
+def compact_example(post: Dict) -> Dict:
+    compacted = {}
+    for key, value in post.items():
+        if key in REMOVED_FIELDS or value in ("", None, [], {}):
+            continue
+        if key == "hashtags" and isinstance(value, list):
+            value = list(dict.fromkeys(hashtag.lower() for hashtag in value))
+        elif key == "date":
+            value = str(value)[:10]
+        compacted[key] = value
+    return compacted
+
+
+def compact_examples(examples, token_budget: int) -> str:
+    if not isinstance(examples, list):
+        return str(examples or "")
+
+    lines: List[str] = []
+    used_tokens = 0
+    for example in examples:
+        if not isinstance(example, dict):
+            continue
+        line = json.dumps(compact_example(example), ensure_ascii=False, separators=(",", ":"))
+        tokens = estimate_tokens(line)
+        if used_tokens + tokens > token_budget:
+            continue
+        lines.append(line)
+        used_tokens += tokens
+    return "\n".join(lines)
@@ -0,0 +1,152 @@
+"""
+This module implements a small persistent job queue used to run long tasks, such as scraping Instagram profiles,
+outside of the Gradio request handlers.
+
+Jobs are stored in a SQLite table inside `DATA_DIR`, together with their status (`queued`, `running`, `done` or
+`failed`), so they can be polled from the UI and survive restarts: jobs that were queued or running when the
+application stopped are queued again on start-up.
+
+A fixed number of worker threads claim the queued jobs in order and run the handler registered for the job kind with
+the job payload. `submit(..., unique=True)` does not queue a job if the same one is already queued or running, and
+`jobs(kind, **payload_fields)` lists the latest jobs whose payload has the given values.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger()
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    def __init__(
+        self,
+        filepath: str,
+        handlers: Dict[str, Callable[[Dict], None]],
+        workers: int,
+        poll_interval: float = 1.0,
+    ):
+        self._handlers = handlers
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._connection = sqlite3.connect(filepath, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, status TEXT NOT NULL, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)"
+            )
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (QUEUED, time.time(), RUNNING),
+            )
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{idx}", daemon=True)
+            for idx in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, kind: str, payload: Dict, unique: bool = False) -> int:
+        now = time.time()
+        with self._lock, self._connection:
+            # The check and the insert run in the same write transaction, so that concurrent submissions (even from
+            # another process) cannot queue the same job twice
+            self._connection.execute("BEGIN IMMEDIATE")
+            if unique:
+                row = self._connection.execute(
+                    "SELECT id FROM jobs WHERE kind = ? AND payload = ? AND status IN (?, ?) ORDER BY id LIMIT 1",
+                    (kind, json.dumps(payload), QUEUED, RUNNING),
+                ).fetchone()
+                if row is not None:
+                    logger.info(f"The {kind} job with payload {payload} is already pending as job {row[0]}")
+                    return row[0]
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (kind, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), QUEUED, now, now),
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        logger.info(f"Submitted {kind} job {cursor.lastrowid} with payload {payload}")
+        return cursor.lastrowid
+
+    def jobs(self, kind: Optional[str] = None, limit: int = 20, **payload_fields) -> List[Dict]:
+        conditions = []
+        parameters = []
+        if kind is not None:
+            conditions.append("kind = ?")
+            parameters.append(kind)
+        for field, value in payload_fields.items():
+            conditions.append("json_extract(payload, ?) = ?")
+            parameters += [f"$.{field}", value]
+        query = "SELECT id, kind, payload, status, error, updated_at FROM jobs"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            rows = self._connection.execute(
+                query + " ORDER BY id DESC LIMIT ?", (*parameters, limit)
+            ).fetchall()
+        return [
+            {
+                "id": job_id,
+                "kind": job_kind,
+                "payload": json.loads(payload),
+                "status": status,
+                "error": error,
+                "updated_at": updated_at,
+            }
+            for job_id, job_kind, payload, status, error, updated_at in rows
+        ]
+
+    def _claim(self) -> Optional[tuple]:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT id, kind, payload FROM jobs WHERE status = ? ORDER BY id LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, time.time(), row[0]),
+            )
+        return row
+
+    def _finish(self, job_id: int, status: str, error: Optional[str] = None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self._poll_interval)
+                continue
+
+            job_id, kind, payload = job
+            logger.info(f"Running {kind} job {job_id}")
+            try:
+                self._handlers[kind](json.loads(payload))
+            except Exception as e:
+                logger.exception(f"Job {job_id} of kind {kind} failed")
+                self._finish(job_id, FAILED, str(e))
+            else:
+                self._finish(job_id, DONE)
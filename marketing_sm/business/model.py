@@ -1,12 +1,13 @@
 """
 This script defines two classes, `Description` and `Business`, for managing business-related data and their
 associated descriptions, suggestions, Instagram profiles, and colors. Additionally, it includes a `State` class
-to manage the state of multiple businesses and functionality to load and store this state from/to a JSON file.
+to manage the state of multiple businesses and functionality to load and store this state through a `StateStore`
+backend (see `marketing_sm.data.storage`).
 
 ### Components
 
 1. **Imports**:
-   - `json`: Used for serializing and deserializing data to/from JSON format.
+   - `json`: Used for reading the legacy JSON state file.
    - `os`: Provides functionality to interact with the operating system, used for file path management.
    - `time`: Used for generating timestamps.
    - `dataclasses`: Provides the `dataclass` decorator to simplify class definitions.
@@ -27,27 +28,53 @@ to manage the state of multiple businesses and functionality to load and store t
        - `name`: The name of the business.
        - `descriptions`: A dictionary of descriptions related to the business.
        - `suggestions`: A dictionary of suggestions for the business.
-       - `instagram_urls`: A dictionary of Instagram URLs and their scraped profiles.
+       - `instagram_urls`: A dictionary of Instagram URLs and their scraped profiles (`ScrapedProfile` instances, see
+         `marketing_sm.data.posts`).
        - `colors`: A list of colors associated with the business.
      - **Methods**:
        - `add_description(title: str, description: str)`: Adds a description to the business.
        - `add_suggestion(title: str, suggestion: str)`: Adds a suggestion to the business.
-       - `add_instagram(instagram_url: str, scraped_profile: str)`: Adds an Instagram URL and its scraped profile.
+       - `add_instagram(instagram_url: str, scraped_profile: ScrapedProfile)`: Adds an Instagram URL and its scraped profile.
        - `save_colors(colors: List[str])`: Saves a list of colors associated with the business.
        - `to_dict() -> Dict`: Converts the business instance to a dictionary.
-       - `from_dict(data: Dict) -> 'Business'`: Creates a `Business` instance from a dictionary.
+       - `from_dict(data: Dict) -> 'Business'`: Creates a `Business` instance from a dictionary. Scraped profiles
+         stored as lists of posts by previous versions are converted to `ScrapedProfile`.
+
+   - **`BusinessLocks`**:
+     - **Purpose**: Creates and keeps one reentrant lock per business name, so that concurrent sessions only wait for
+       each other when they change the same business.
+
+   - **`LazyBusinesses`**:
+     - **Purpose**: A mapping of business names to `Business` instances backed by a `StateStore`. Only the names are
+       loaded when it is created; a business is loaded from the store the first time it is accessed, and at most
+       `max_resident` businesses are kept in memory, evicting the least recently used ones. Evicting is safe because
+       every change is queued to the store by `State` as soon as it is made, and a business is loaded while holding
+       its lock, after the queued changes are written. `refresh()` reads the names again and drops resident
+       businesses, so that changes made by other replicas sharing the store are seen.
 
    - **`State`**:
-     - **Purpose**: Manages the state of multiple businesses and provides functionality to store and load the state from a file.
+     - **Purpose**: Manages the state of multiple businesses and persists every mutation through its store. It is
+       shared by every session of the interface, so every mutation is made while holding the lock of its business.
      - **Attributes**:
-       - `businesses`: A dictionary of `Business` instances indexed by business names.
+       - `businesses`: A mapping of `Business` instances indexed by business names (a `LazyBusinesses` when loaded from a store).
+       - `store`: The `StateStore` used for persistence, if any.
+       - `locks`: The `BusinessLocks` of the businesses.
      - **Methods**:
        - `from_dict(data: Dict) -> 'State'`: Creates a `State` instance from a dictionary.
-       - `store_state()`: Stores the current state to a JSON file.
+       - `lock(business: str)`: Returns the lock of a business, to make a check and a mutation atomic.
+       - `refresh(business: Optional[str] = None)`: When the store is shared with other replicas, reads the business
+         names again and reloads the given business (or every business) on its next access.
+       - `add_business(name: str) -> Business`: Adds and persists a new business, or returns the existing one.
+       - `add_description`, `add_suggestion`, `add_instagram`, `save_colors`: Update a business and persist only the
+         changed description, suggestion, profile or colors.
+       - `store_state()`: Stores the whole state at once.
 
 3. **Functions**:
    - **`load_state() -> State`**:
-     - **Purpose**: Loads the state of businesses from a JSON file, or initializes an empty state if the file is not found or is corrupted.
+     - **Purpose**: Loads the names of the businesses from the configured `StateStore`; the businesses themselves are
+       loaded on first access, keeping at most `state_max_resident_businesses` in memory. Changes are written by a
+       single background writer (a `CoalescingStateStore`), which batches the changes of concurrent sessions. When the
+       store is empty, the legacy JSON file is imported into it, if present.
      - **Returns**: An instance of `State` with loaded or initialized businesses.
 
 ### Example Usage
@@ -62,11 +89,20 @@ This script provides a structured way to handle business-related data and mainta
 
 import json
 import os
+import threading
 import time
-from dataclasses import dataclass
-from typing import Dict, List
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional
 
 from marketing_sm.data.constants import DATA_DIR, STATE_FILENAME
+from marketing_sm.data.posts import ScrapedProfile
+from marketing_sm.data.storage import CoalescingStateStore, StateStore, create_store
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.settings import get_settings
+
+settings = get_settings()
 
 
 @dataclass
@@ -93,14 +129,24 @@ class Business:
     def add_suggestion(self, title: str, suggestion: str):
         self.suggestions[title] = Description(title, suggestion)
 
-    def add_instagram(self, instagram_url: str, scraped_profile: str):
+    def add_instagram(self, instagram_url: str, scraped_profile: ScrapedProfile):
         self.instagram_urls[instagram_url] = Description(instagram_url, scraped_profile)
 
     def save_colors(self, colors: List[str]):
         self.colors = colors
 
     def to_dict(self) -> Dict:
-        return self.__dict__
+        return {
+            "name": self.name,
+            "descriptions": {k: asdict(v) for k, v in self.descriptions.items()},
+            "suggestions": {k: asdict(v) for k, v in self.suggestions.items()},
+            # Profiles are immutable once scraped, they do not need to be copied like asdict does
+            "instagram_urls": {
+                k: {"title": v.title, "description": v.description}
+                for k, v in self.instagram_urls.items()
+            },
+            "colors": self.colors,
+        }
 
     @classmethod
     def from_dict(cls, data: Dict) -> "Business":
@@ -112,38 +158,194 @@ class Business:
             k: Description.from_dict(v) for k, v in data.get("suggestions", {}).items()
         }
         business.instagram_urls = {
-            k: Description.from_dict(v)
+            k: Description(v["title"], ScrapedProfile.from_value(v["description"]))
             for k, v in data.get("instagram_urls", {}).items()
         }
         business.colors = data.get("colors", [])
         return business
 
 
+class BusinessLocks:
+    def __init__(self):
+        self._locks: Dict[str, threading.RLock] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name: str) -> threading.RLock:
+        with self._lock:
+            lock = self._locks.get(name)
+            if lock is None:
+                lock = self._locks[name] = threading.RLock()
+            return lock
+
+
+class LazyBusinesses(MutableMapping):
+    def __init__(self, store: StateStore, max_resident: int, locks: Optional[BusinessLocks] = None):
+        self._store = store
+        self._max_resident = max_resident
+        self._locks = locks or BusinessLocks()
+        self._lock = threading.Lock()
+        with metrics.timed("load_business_names"):
+            self._names: Dict[str, None] = dict.fromkeys(store.load_business_names())
+        self._resident: "OrderedDict[str, Business]" = OrderedDict()
+
+    def __getitem__(self, name: str) -> Business:
+        with self._lock:
+            if name not in self._names:
+                raise KeyError(name)
+            if name in self._resident:
+                self._resident.move_to_end(name)
+                return self._resident[name]
+        # A business is not loaded while one of its changes is being made, so the load sees it
+        with self._locks(name):
+            with metrics.timed("load_business"):
+                data = self._store.load_business(name)
+            business = Business.from_dict(data) if data is not None else Business(name)
+            with self._lock:
+                # Another thread may have loaded it meanwhile, keep a single instance
+                business = self._resident.setdefault(name, business)
+                self._resident.move_to_end(name)
+                self._evict()
+        return business
+
+    def __setitem__(self, name: str, business: Business):
+        with self._lock:
+            self._names[name] = None
+            self._resident[name] = business
+            self._resident.move_to_end(name)
+            self._evict()
+
+    def __delitem__(self, name: str):
+        with self._lock:
+            del self._names[name]
+            self._resident.pop(name, None)
+
+    def __contains__(self, name) -> bool:
+        return name in self._names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._names))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __repr__(self) -> str:
+        return f"LazyBusinesses({len(self._names)} businesses, {len(self._resident)} resident)"
+
+    def refresh(self, name: Optional[str] = None):
+        with metrics.timed("load_business_names"):
+            names = self._store.load_business_names()
+        stored = set(names)
+        with self._lock:
+            # Businesses added here after the names were read are kept
+            added = [resident for resident in self._resident if resident not in stored]
+            self._names = dict.fromkeys(names + added)
+            stale = [name] if name is not None else [
+                resident for resident in self._resident if resident in stored
+            ]
+            for resident in stale:
+                self._resident.pop(resident, None)
+
+    def _evict(self):
+        while len(self._resident) > self._max_resident:
+            self._resident.popitem(last=False)
+
+
 @dataclass
 class State:
-    businesses: Dict[str, Business]
+    businesses: MutableMapping
+    store: Optional[StateStore] = field(default=None, repr=False)
+    locks: BusinessLocks = field(default_factory=BusinessLocks, repr=False)
 
     @staticmethod
-    def from_dict(data: Dict) -> "State":
+    def from_dict(data: Dict, store: Optional[StateStore] = None) -> "State":
         businesses = {
             name: Business.from_dict(business_data)
             for name, business_data in data.get("businesses", {}).items()
         }
-        return State(businesses=businesses)
+        return State(businesses=businesses, store=store)
+
+    def lock(self, business: str) -> threading.RLock:
+        return self.locks(business)
+
+    def refresh(self, business: Optional[str] = None):
+        if self.store is not None and self.store.shared and isinstance(self.businesses, LazyBusinesses):
+            self.businesses.refresh(business)
+
+    def add_business(self, name: str) -> Business:
+        with self.lock(name):
+            if name in self.businesses:
+                return self.businesses[name]
+            business = Business(name)
+            self.businesses[name] = business
+            if self.store is not None:
+                self.store.save_business(name, business.colors)
+        return business
+
+    def add_description(self, business: str, title: str, description: str):
+        with self.lock(business):
+            self.businesses[business].add_description(title, description)
+            self._save_entry(business, "descriptions", title, description)
+
+    def add_suggestion(self, business: str, title: str, suggestion: str):
+        with self.lock(business):
+            self.businesses[business].add_suggestion(title, suggestion)
+            self._save_entry(business, "suggestions", title, suggestion)
+
+    def add_instagram(self, business: str, instagram_url: str, scraped_profile: ScrapedProfile):
+        with self.lock(business):
+            self.businesses[business].add_instagram(instagram_url, scraped_profile)
+            self._save_entry(business, "instagram_urls", instagram_url, scraped_profile)
+
+    def save_colors(self, business: str, colors: List[str]):
+        with self.lock(business):
+            self.businesses[business].save_colors(list(colors))
+            if self.store is not None:
+                self.store.save_business(business, colors)
+
+    def _save_entry(self, business: str, kind: str, title: str, value):
+        if self.store is not None:
+            self.store.save_entry(business, kind, title, value)
 
     def store_state(self):
-        filepath = os.path.join(DATA_DIR, STATE_FILENAME)
-        print(f"Storing state: {self} in file {filepath}")
-        with open(filepath, "w") as f:
-            json.dump(self.__dict__, f, default=vars)
+        if self.store is None:
+            return
+        print(f"Storing state of {len(self.businesses)} businesses")
+        businesses = {}
+        for name in list(self.businesses.keys()):
+            with self.lock(name):
+                businesses[name] = self.businesses[name].to_dict()
+        with metrics.timed("store_state"):
+            self.store.save_businesses(businesses)
 
 
 def load_state() -> State:
+    store = CoalescingStateStore(
+        create_store(settings),
+        settings.state_write_delay_seconds,
+        retry_delay=settings.retry_base_delay,
+        max_retry_delay=settings.retry_max_delay,
+    )
+    locks = BusinessLocks()
+    businesses = LazyBusinesses(store, settings.state_max_resident_businesses, locks)
+    state = State(businesses=businesses, store=store, locks=locks)
+    print(f"Found {len(businesses)} businesses in the {settings.state_backend} store")
+    if not businesses:
+        legacy_state = _load_legacy_state()
+        if legacy_state.businesses:
+            state.businesses = legacy_state.businesses
+            state.store_state()
+            print(f"Imported {len(state.businesses)} businesses from file {STATE_FILENAME}")
+            state.businesses = LazyBusinesses(store, settings.state_max_resident_businesses, locks)
+    return state
+
+
+def _load_legacy_state() -> State:
     filepath = os.path.join(DATA_DIR, STATE_FILENAME)
+    data = None
     try:
         with open(filepath, "r") as f:
-            data = json.load(f)
-        state = State.from_dict(data)
+            data = f.read()
+        state = State.from_dict(json.loads(data))
         print(f"Loading state {state} from file {STATE_FILENAME}")
     except FileNotFoundError:
         state = State(businesses={})
@@ -151,6 +353,6 @@ def load_state() -> State:
     except json.JSONDecodeError:
         if data:
             with open(filepath + str(time.time()), "w") as f:
-                json.dump(data, f)
+                f.write(data)
         state = State(businesses={})
     return state
@@ -0,0 +1,144 @@
+"""
+This module implements a small content-addressed cache stored on disk. Entries are raw bytes saved under a key derived
+from a SHA-256 hash of their inputs, spread over two-character sub-directories to keep directories small.
+
+The cache is bounded in size: every read refreshes the entry access time and the least recently used entries are
+evicted once `max_bytes` is exceeded. The access order is rebuilt from the access times when the cache is opened, so it
+survives restarts. The modification time records when an entry was written, and entries older than `ttl` seconds (if
+given) are treated as misses and removed. Hit and miss counters are kept for monitoring.
+
+`get_path` returns the path of an entry instead of its content, and `put` returns the path of the written entry, so
+files can be served or copied without being read into memory. Entries are named after their key followed by `suffix`
+(for example a file extension).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger()
+
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int, ttl: Optional[float] = None, suffix: str = ""):
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.ttl: Optional[float] = ttl
+        self.suffix: str = suffix
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size: int = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_entries()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+            return None
+
+    def get_path(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        path = self.path(key)
+        try:
+            written_at = os.path.getmtime(path)
+            if self.ttl is not None and time.time() - written_at > self.ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            os.utime(path, (time.time(), written_at))
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            # A failed write (such as a full disk) must not leave its temporary file behind
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            self._evict()
+        return path
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def _forget(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            logger.info(f"Evicted {key} from cache {self.directory}")
+
+    def _load_entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    os.remove(os.path.join(root, name))
+                    continue
+                if not name.endswith(self.suffix):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_atime, name[: len(name) - len(self.suffix)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
@@ -7,3 +7,10 @@ values, the codebase becomes more consistent and easier to maintain.
 DATA_DIR = "./app/data"
 VECTOR_DB_DIR = "./app/db"
 STATE_FILENAME = "state.json"
+STATE_DB_FILENAME = "state.db"
+STATE_JOURNAL_FILENAME = "state.journal"
+IMAGE_CACHE_DIR = "images"
+THUMBNAIL_CACHE_DIR = "thumbnails"
+TEXT_CACHE_DIR = "responses"
+JOBS_DB_FILENAME = "jobs.db"
+CAMPAIGNS_DIR = "campaigns"
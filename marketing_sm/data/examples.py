@@ -0,0 +1,108 @@
+"""
+This module indexes the scraped Instagram posts of every business in a ChromaDB collection stored in `VECTOR_DB_DIR`, so
+that only the most useful examples are sent to the text generation model instead of the whole scraped profile.
+
+Posts are embedded locally with ChromaDB's default embedding function (a small ONNX sentence transformer). When
+examples are requested, the posts closest to the query (usually the month, suggestions and description of the
+request) are retrieved and re-ranked by combining their similarity with their engagement (likes and comments).
+
+`index_profile(..., skip_indexed=True)` only embeds the posts that are not indexed yet, which is used to catch up on
+the posts of a profile stored before it was indexed.
+"""
+
+import hashlib
+import json
+import logging
+import math
+from typing import Dict, List
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+from marketing_sm.data.constants import VECTOR_DB_DIR
+from marketing_sm.data.posts import ScrapedPost, ScrapedProfile
+
+logger = logging.getLogger()
+
+SIMILARITY_WEIGHT = 0.7
+ENGAGEMENT_WEIGHT = 0.3
+CANDIDATES_FACTOR = 3
+
+
+def _post_document(post: ScrapedPost) -> str:
+    return " ".join([post.caption, post.alt, " ".join(post.hashtags)]).strip()
+
+
+def _post_id(url: str, post: ScrapedPost) -> str:
+    key = json.dumps([url, post.date, post.caption])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ExamplesIndex:
+    def __init__(self, directory: str = VECTOR_DB_DIR):
+        self._client = chromadb.PersistentClient(path=directory)
+        self._embedding_function = embedding_functions.DefaultEmbeddingFunction()
+
+    def _collection(self, business: str):
+        name = "business-" + hashlib.sha256(business.encode("utf-8")).hexdigest()[:32]
+        return self._client.get_or_create_collection(
+            name,
+            embedding_function=self._embedding_function,
+            metadata={"hnsw:space": "cosine", "business": business},
+        )
+
+    def index_profile(self, business: str, url: str, posts: ScrapedProfile, skip_indexed: bool = False):
+        posts = [post for post in posts if _post_document(post)]
+        collection = self._collection(business)
+        if skip_indexed and posts:
+            indexed = set(collection.get(where={"url": url}, include=[])["ids"])
+            posts = [post for post in posts if _post_id(url, post) not in indexed]
+        if not posts:
+            return
+        collection.upsert(
+            ids=[_post_id(url, post) for post in posts],
+            documents=[_post_document(post) for post in posts],
+            metadatas=[
+                {
+                    "url": url,
+                    "likes": post.likes,
+                    "comments": post.comments,
+                    "post": json.dumps(post.to_dict()),
+                }
+                for post in posts
+            ],
+        )
+        logger.info(f"Indexed {len(posts)} posts from {url} for business {business}")
+
+    def relevant_examples(
+        self, business: str, url: str, posts: ScrapedProfile, query: str, top_k: int
+    ) -> List[Dict]:
+        collection = self._collection(business)
+        if not collection.get(where={"url": url}, limit=1)["ids"]:
+            self.index_profile(business, url, posts)
+
+        indexed = len(collection.get(where={"url": url}, include=[])["ids"])
+        if not indexed:
+            return []
+        results = collection.query(
+            query_texts=[query],
+            n_results=min(top_k * CANDIDATES_FACTOR, indexed),
+            where={"url": url},
+            include=["metadatas", "distances"],
+        )
+        candidates = list(zip(results["metadatas"][0], results["distances"][0]))
+        engagements = [
+            math.log1p(metadata["likes"] + 2 * metadata["comments"])
+            for metadata, _ in candidates
+        ]
+        max_engagement = max(engagements) or 1.0
+        scored = [
+            (
+                SIMILARITY_WEIGHT * (1 - distance)
+                + ENGAGEMENT_WEIGHT * engagement / max_engagement,
+                json.loads(metadata["post"]),
+            )
+            for (metadata, distance), engagement in zip(candidates, engagements)
+        ]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [post for _, post in scored[:top_k]]
@@ -0,0 +1,103 @@
+"""
+This module defines the interface of the image generation providers used by `marketing_sm.business.ai`, and its
+implementation for the Pollinations AI API.
+
+`PollinationsImageProvider` talks to any server exposing the Pollinations `/prompt/<prompt>` endpoint, so pointing
+`image_provider_url` to the local fake server in `marketing_sm.infrastructure.fakes` gives a deterministic, offline
+environment for load testing.
+
+Requests are sent through a pooled `HTTPClient` (see `marketing_sm.infrastructure.http_client`) with as many
+connections as `image_concurrency`, so connections are reused across images.
+
+Providers raise a `RetryableError` when they are throttled (429 or 5xx responses) or cannot be reached.
+`create_image_provider` wraps the provider in a `LimitedImageProvider`, which runs every request through an
+`AdaptiveLimiter` (see `marketing_sm.infrastructure.ratelimit`) and returns `None` once the retries are exhausted.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+from marketing_sm.infrastructure.http_client import (
+    HTTPClient,
+    HTTPClientError,
+    TransportError,
+    create_http_client,
+)
+from marketing_sm.infrastructure.ratelimit import (
+    RETRYABLE_STATUS_CODES,
+    AdaptiveLimiter,
+    RetryableError,
+    create_limiter,
+    parse_retry_after,
+)
+from marketing_sm.infrastructure.settings import Settings
+
+logger = logging.getLogger()
+
+
+class ImageProvider(ABC):
+    @property
+    @abstractmethod
+    def cache_params(self) -> Tuple:
+        pass
+
+    @abstractmethod
+    def generate(self, prompt: str) -> Optional[bytes]:
+        pass
+
+
+class PollinationsImageProvider(ImageProvider):
+    def __init__(self, base_url: str, client: HTTPClient):
+        self._base_url = base_url.rstrip("/")
+        self._client = client
+
+    @property
+    def cache_params(self) -> Tuple:
+        return (self._base_url,)
+
+    def generate(self, prompt: str) -> Optional[bytes]:
+        try:
+            response = self._client.post(f"{self._base_url}/{prompt}")
+        except TransportError as e:
+            raise RetryableError(f"Image request failed: {e}") from e
+        except HTTPClientError as e:
+            logger.warning(f"Image request failed for prompt {prompt}: {e}")
+            return None
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise RetryableError(
+                f"Image request returned {response.status_code}",
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+            )
+        if response.status_code != 200:
+            logger.warning(f"Image request returned {response.status_code} for prompt {prompt}")
+            return None
+        return response.content
+
+
+class LimitedImageProvider(ImageProvider):
+    def __init__(self, provider: ImageProvider, limiter: AdaptiveLimiter):
+        self._provider = provider
+        self._limiter = limiter
+
+    @property
+    def cache_params(self) -> Tuple:
+        return self._provider.cache_params
+
+    def generate(self, prompt: str) -> Optional[bytes]:
+        try:
+            return self._limiter.call(self._provider.generate, prompt)
+        except RetryableError as e:
+            logger.warning(f"Giving up on image for prompt {prompt}: {e}")
+            return None
+
+
+def create_image_provider(settings: Settings) -> ImageProvider:
+    client = create_http_client(
+        "images", settings.image_concurrency, settings, settings.image_request_timeout
+    )
+    provider = PollinationsImageProvider(settings.image_provider_url, client)
+    limiter = create_limiter(
+        "images", settings.image_concurrency, settings, settings.image_requests_per_minute
+    )
+    return LimitedImageProvider(provider, limiter)
@@ -0,0 +1,110 @@
+"""
+This module provides an incremental parser for the JSON produced by the text generation model. The model output follows
+the `Posts` schema defined in `marketing_sm.data.prompts`, i.e. a single object with a `posts` array. Instead of waiting
+for the whole stream to finish, `IncrementalPostsParser` is fed the streamed chunks and returns every post object as soon
+as its closing brace arrives, so that downstream stages (image generation, UI updates) can start on it right away.
+
+Anything before the first `{` (such as a markdown code fence or a sentence with brackets and quotes) and after the top
+level object is closed is ignored. Every chunk is scanned once, jumping between the characters that matter to the JSON
+structure, and only the text of the post being streamed is buffered until it is closed. Posts are validated against
+the `Post` schema, and the invalid ones are logged and skipped.
+"""
+
+import json
+import logging
+import re
+from typing import Dict, List
+
+from pydantic import ValidationError
+
+from marketing_sm.data.prompts import Post
+
+logger = logging.getLogger()
+
+STRUCTURE = re.compile(r'[{}\[\]"\\]')
+
+
+class IncrementalPostsParser:
+    def __init__(self):
+        self.posts_found: int = 0
+        self._chunks: List[str] = []
+        self._post_chunks: List[str] = []
+        self._stack: List[str] = []
+        self._in_string: bool = False
+        self._escaped: bool = False
+        self._in_post: bool = False
+        self._done: bool = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> List[Dict]:
+        self._chunks.append(chunk)
+        if self._done:
+            return []
+        posts = []
+        post_start = 0
+        skip_until = 0
+        if self._escaped:
+            # The escaped character is the first one of this chunk
+            self._escaped = False
+            skip_until = 1
+        for match in STRUCTURE.finditer(chunk):
+            position = match.start()
+            if position < skip_until:
+                continue
+            char = match.group()
+            if self._in_string:
+                if char == "\\":
+                    if position + 1 < len(chunk):
+                        skip_until = position + 2
+                    else:
+                        self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif not self._stack:
+                # Only the top level object is parsed, brackets and quotes before it are ignored
+                if char == "{":
+                    self._stack.append(char)
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._stack == ["{", "["]:
+                    self._in_post = True
+                    self._post_chunks = []
+                    post_start = position
+                self._stack.append(char)
+            elif char in "}]":
+                self._stack.pop()
+                if char == "}" and self._stack == ["{", "["] and self._in_post:
+                    self._post_chunks.append(chunk[post_start: position + 1])
+                    post = self._parse_post("".join(self._post_chunks))
+                    if post is not None:
+                        posts.append(post)
+                    self._in_post = False
+                    self._post_chunks = []
+                if not self._stack:
+                    self._done = True
+                    break
+        if self._in_post:
+            self._post_chunks.append(chunk[post_start:])
+        return posts
+
+    def _parse_post(self, raw: str):
+        try:
+            post = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Could not parse streamed post {raw}: {e}")
+            return None
+        if not isinstance(post, dict):
+            return None
+        post.setdefault("prompt_image", [])
+        post.setdefault("caption_image", [])
+        try:
+            post = Post.model_validate(post).model_dump()
+        except ValidationError as e:
+            logger.warning(f"Streamed post does not match the schema {raw}: {e}")
+            return None
+        self.posts_found += 1
+        return post
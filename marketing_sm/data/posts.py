@@ -0,0 +1,295 @@
+"""
+This module defines the compact representation of a scraped Instagram profile.
+
+A `ScrapedProfile` stores its posts column by column instead of as one dictionary per post:
+
+- likes, comments and dates (milliseconds since the epoch, `-1` when unknown) are kept in typed `array` columns;
+- hashtags are stored once per profile in an interned vocabulary, and every post keeps the indices of its hashtags;
+- captions, alt texts and image URLs are kept in flat lists, with offset columns for the variable number of images and
+  hashtags of every post.
+
+Posts are read as lightweight `ScrapedPost` objects (with `__slots__`), created on access. `ScrapedPost.to_dict` and
+`ScrapedProfile.from_dicts` convert from and to the dictionaries produced by `marketing_sm.data.scraper.mapping_fun`,
+which is also the legacy storage format (`ScrapedProfile.from_value` accepts both).
+
+Profiles have their own binary encoding (`encode` / `decode`): a magic header followed by a zlib-compressed body with
+the numeric columns as little-endian arrays and every string as UTF-8, prefixed by a table of their lengths.
+"""
+
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b"SPF1"
+HEADER = struct.Struct("<IIII")
+UNKNOWN_DATE = -1
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_date(value) -> int:
+    if not value:
+        return UNKNOWN_DATE
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return UNKNOWN_DATE
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def format_date(milliseconds: int) -> str:
+    if milliseconds == UNKNOWN_DATE:
+        return ""
+    seconds, millis = divmod(milliseconds, 1000)
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime(DATE_FORMAT) + f".{millis:03d}Z"
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _read_column(typecode: str, data: memoryview, offset: int, length: int) -> Tuple[array, int]:
+    column = array(typecode)
+    end = offset + length * column.itemsize
+    column.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column, end
+
+
+class ScrapedPost:
+    __slots__ = ("caption", "alt", "likes", "comments", "date", "hashtags", "images")
+
+    def __init__(
+        self,
+        caption: str,
+        alt: str,
+        likes: int,
+        comments: int,
+        date: str,
+        hashtags: Tuple[str, ...],
+        images: Tuple[str, ...],
+    ):
+        self.caption = caption
+        self.alt = alt
+        self.likes = likes
+        self.comments = comments
+        self.date = date
+        self.hashtags = hashtags
+        self.images = images
+
+    def to_dict(self) -> Dict:
+        return {
+            "caption": self.caption,
+            "alt": self.alt,
+            "commentsCount": self.comments,
+            "hashtags": list(self.hashtags),
+            "images": list(self.images),
+            "likesCount": self.likes,
+            "date": self.date,
+        }
+
+    def __repr__(self) -> str:
+        return f"ScrapedPost(date={self.date!r}, caption={self.caption[:30]!r})"
+
+
+class ScrapedProfile:
+    __slots__ = (
+        "_captions",
+        "_alts",
+        "_likes",
+        "_comments",
+        "_dates",
+        "_tags",
+        "_tag_index",
+        "_tag_ids",
+        "_tag_offsets",
+        "_images",
+        "_image_offsets",
+    )
+
+    def __init__(self):
+        self._captions: List[str] = []
+        self._alts: List[str] = []
+        self._likes = array("q")
+        self._comments = array("q")
+        self._dates = array("q")
+        self._tags: List[str] = []
+        self._tag_index: Dict[str, int] = {}
+        self._tag_ids = array("I")
+        self._tag_offsets = array("I", [0])
+        self._images: List[str] = []
+        self._image_offsets = array("I", [0])
+
+    @classmethod
+    def from_dicts(cls, items) -> "ScrapedProfile":
+        profile = cls()
+        if not isinstance(items, list):
+            return profile
+        for item in items:
+            profile.append(
+                caption=item.get("caption") or "",
+                alt=item.get("alt") or "",
+                likes=_to_int(item.get("likesCount")),
+                comments=_to_int(item.get("commentsCount")),
+                date=parse_date(item.get("date") or item.get("timestamp")),
+                hashtags=item.get("hashtags") or (),
+                images=item.get("images") or (),
+            )
+        return profile
+
+    @classmethod
+    def from_value(cls, value) -> "ScrapedProfile":
+        # Profiles stored before the compact format are lists of dictionaries
+        if isinstance(value, ScrapedProfile):
+            return value
+        if isinstance(value, (bytes, memoryview)):
+            return cls.decode(bytes(value))
+        return cls.from_dicts(value)
+
+    @classmethod
+    def from_posts(cls, posts: Iterable[ScrapedPost]) -> "ScrapedProfile":
+        profile = cls()
+        for post in posts:
+            profile.append(
+                post.caption, post.alt, post.likes, post.comments, parse_date(post.date), post.hashtags, post.images
+            )
+        return profile
+
+    def append(
+        self,
+        caption: str,
+        alt: str,
+        likes: int,
+        comments: int,
+        date: int,
+        hashtags: Iterable[str],
+        images: Iterable[str],
+    ):
+        self._captions.append(caption)
+        self._alts.append(alt)
+        self._likes.append(likes)
+        self._comments.append(comments)
+        self._dates.append(date)
+        for hashtag in hashtags:
+            self._tag_ids.append(self._tag_id(hashtag))
+        self._tag_offsets.append(len(self._tag_ids))
+        self._images.extend(images)
+        self._image_offsets.append(len(self._images))
+
+    def _tag_id(self, hashtag: str) -> int:
+        tag_id = self._tag_index.get(hashtag)
+        if tag_id is None:
+            tag_id = len(self._tags)
+            self._tags.append(sys.intern(hashtag))
+            self._tag_index[self._tags[tag_id]] = tag_id
+        return tag_id
+
+    def __len__(self) -> int:
+        return len(self._captions)
+
+    def __getitem__(self, idx: int) -> ScrapedPost:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return ScrapedPost(
+            self._captions[idx],
+            self._alts[idx],
+            self._likes[idx],
+            self._comments[idx],
+            format_date(self._dates[idx]),
+            tuple(
+                self._tags[tag_id]
+                for tag_id in self._tag_ids[self._tag_offsets[idx]: self._tag_offsets[idx + 1]]
+            ),
+            tuple(self._images[self._image_offsets[idx]: self._image_offsets[idx + 1]]),
+        )
+
+    def __iter__(self) -> Iterator[ScrapedPost]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ScrapedProfile) and self.encode() == other.encode()
+
+    def __repr__(self) -> str:
+        return f"ScrapedProfile({len(self)} posts, {len(self._tags)} hashtags)"
+
+    def to_dicts(self) -> List[Dict]:
+        return [post.to_dict() for post in self]
+
+    def latest_date(self) -> Optional[str]:
+        known = [date for date in self._dates if date != UNKNOWN_DATE]
+        return format_date(max(known)) if known else None
+
+    def merge(self, new: "ScrapedProfile") -> "ScrapedProfile":
+        # Posts are identified by their date and caption, the new ones replace the stored ones
+        merged = {(post.date, post.caption): post for post in self}
+        merged.update({(post.date, post.caption): post for post in new})
+        return ScrapedProfile.from_posts(
+            sorted(merged.values(), key=lambda post: post.date, reverse=True)
+        )
+
+    def encode(self) -> bytes:
+        strings = [
+            value.encode("utf-8")
+            for column in (self._captions, self._alts, self._tags, self._images)
+            for value in column
+        ]
+        body = b"".join(
+            [
+                HEADER.pack(len(self), len(self._tags), len(self._tag_ids), len(self._images)),
+                _little_endian(self._likes),
+                _little_endian(self._comments),
+                _little_endian(self._dates),
+                _little_endian(self._tag_ids),
+                _little_endian(self._tag_offsets),
+                _little_endian(self._image_offsets),
+                _little_endian(array("I", [len(value) for value in strings])),
+            ]
+            + strings
+        )
+        return MAGIC + zlib.compress(body, 1)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "ScrapedProfile":
+        if data[: len(MAGIC)] != MAGIC:
+            raise ValueError("Not an encoded scraped profile")
+        body = memoryview(zlib.decompress(data[len(MAGIC):]))
+        posts, tags, tag_ids, images = HEADER.unpack_from(body)
+        offset = HEADER.size
+
+        profile = cls()
+        profile._likes, offset = _read_column("q", body, offset, posts)
+        profile._comments, offset = _read_column("q", body, offset, posts)
+        profile._dates, offset = _read_column("q", body, offset, posts)
+        profile._tag_ids, offset = _read_column("I", body, offset, tag_ids)
+        profile._tag_offsets, offset = _read_column("I", body, offset, posts + 1)
+        profile._image_offsets, offset = _read_column("I", body, offset, posts + 1)
+        lengths, offset = _read_column("I", body, offset, 2 * posts + tags + images)
+
+        strings = []
+        for length in lengths:
+            strings.append(str(body[offset: offset + length], "utf-8"))
+            offset += length
+        profile._captions = strings[:posts]
+        profile._alts = strings[posts: 2 * posts]
+        profile._tags = [sys.intern(tag) for tag in strings[2 * posts: 2 * posts + tags]]
+        profile._tag_index = {tag: tag_id for tag_id, tag in enumerate(profile._tags)}
+        profile._images = strings[2 * posts + tags:]
+        return profile
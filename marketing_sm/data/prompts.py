@@ -2,7 +2,8 @@
 The code sets up a system for generating Instagram content, using PromptTemplate for content creation and Pydantic
 models to structure the data. It includes templates for guiding content creation and models for defining post details,
 such as captions, content types, and image prompts. The JsonOutputParser ensures the generated content follows the
-specified structure.
+specified structure. FAN_OUT_HINT is appended to the user message of every part of a month generated in concurrent
+requests: it gives the part its own period of the month and lists what the other parts cover.
 """
 
 from typing import List
@@ -43,6 +44,20 @@ content creation.
 """
 )
 
+FAN_OUT_HINT = PromptTemplate.from_template(
+    """
+These posts are part {part} of {parts} of the content for {month}, and the other parts are written separately. This part covers {period} of {month}: base its topics on the holidays, events and seasonal themes of that period.
+The other parts cover: {covered_topics}. Write only the posts listed above, without repeating the periods and topics of the other parts, so that the posts of the month do not repeat each other.
+"""
+)
+
+CATEGORY_LABELS = {
+    "edu_posts": "educational",
+    "int_posts": "interactive",
+    "sell_posts": "promotional",
+    "mot_posts": "motivational",
+}
+
 
 class Post(BaseModel):
     content_type: str = Field(
@@ -2,14 +2,42 @@
 
 This code snippet is designed to scrape data from Instagram using the ApifyWrapper from the langchain_community package.
 It utilizes the Apify platform's "apify/instagram-scraper" actor to extract specific information from Instagram posts.
+
+The scraping itself is done by an `InstagramScraper` provider, selected with the `scraper_provider` setting:
+- `apify` (default): runs the actor on the Apify platform.
+- `local`: requests Apify-like dataset items from the local fake server in `marketing_sm.infrastructure.fakes`, which
+  gives deterministic data for offline load testing.
+
+`scrape_instagram` returns the posts as a compact `ScrapedProfile` (see `marketing_sm.data.posts`). Profiles can be
+refreshed incrementally: `latest_post_date` returns the high-water mark of an already scraped profile,
+`scrape_instagram(url, since=...)` only asks the actor for posts newer than it, and `merge_posts` merges the new posts
+into the stored ones, dropping duplicates.
+
+The scraper is created on the first scrape, so that importing this module does not import the Apify client. It is
+wrapped in a `LimitedInstagramScraper`, which runs every scrape through an `AdaptiveLimiter` (see
+`marketing_sm.infrastructure.ratelimit`) and retries the throttled ones (429 or 5xx responses, connection errors) with
+backoff.
 """
 
-from langchain_community.utilities import ApifyWrapper
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from marketing_sm.data.posts import ScrapedProfile
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.http_client import HTTPClient, TransportError, create_http_client
+from marketing_sm.infrastructure.ratelimit import (
+    RETRYABLE_STATUS_CODES,
+    AdaptiveLimiter,
+    RetryableError,
+    create_limiter,
+    parse_retry_after,
+)
+from marketing_sm.infrastructure.settings import Settings, get_settings
 
-from marketing_sm.infrastructure.settings import Settings
+settings = get_settings()
 
-settings = Settings()
-apify = ApifyWrapper(apify_api_token=settings.apify_api_token)
+RESULTS_LIMIT = 200
 
 
 def mapping_fun(item):
@@ -24,20 +52,110 @@ def mapping_fun(item):
     }
 
 
-def scrape_instagram(url):
-    loader = apify.call_actor(
-        actor_id="apify/instagram-scraper",
-        run_input={
-            "addParentData": False,
-            "directUrls": [url],
-            "enhanceUserSearchWithFacebookPage": False,
-            "isUserTaggedFeedURL": False,
-            "resultsLimit": 200,
-            "resultsType": "posts",
-            "searchLimit": 1,
-            "searchType": "hashtag",
-        },
-        dataset_mapping_function=mapping_fun,
-    )
-    data = loader.load()
-    return data
+def latest_post_date(posts: ScrapedProfile) -> Optional[str]:
+    return posts.latest_date()
+
+
+def merge_posts(existing: ScrapedProfile, new: ScrapedProfile) -> ScrapedProfile:
+    return existing.merge(new)
+
+
+class InstagramScraper(ABC):
+    @abstractmethod
+    def scrape(self, url: str, since: Optional[str] = None) -> List[Dict]:
+        pass
+
+
+class ApifyInstagramScraper(InstagramScraper):
+    def __init__(self, api_token: str):
+        from langchain_community.utilities import ApifyWrapper
+
+        self._apify = ApifyWrapper(apify_api_token=api_token)
+
+    def _scrape(self, url: str, since: Optional[str] = None) -> List[Dict]:
+        loader = self._apify.call_actor(
+            actor_id="apify/instagram-scraper",
+            run_input={
+                "addParentData": False,
+                "directUrls": [url],
+                "enhanceUserSearchWithFacebookPage": False,
+                "isUserTaggedFeedURL": False,
+                "resultsLimit": RESULTS_LIMIT,
+                "resultsType": "posts",
+                "searchLimit": 1,
+                "searchType": "hashtag",
+                **({"onlyPostsNewerThan": since} if since else {}),
+            },
+            dataset_mapping_function=mapping_fun,
+        )
+        data = loader.load()
+        return data
+
+    def scrape(self, url: str, since: Optional[str] = None) -> List[Dict]:
+        try:
+            return self._scrape(url, since)
+        except Exception as e:
+            # Errors of the Apify API client carry the HTTP status of the failed request
+            status_code = getattr(e, "status_code", None)
+            if status_code in RETRYABLE_STATUS_CODES:
+                raise RetryableError(f"Apify returned {status_code}: {e}") from e
+            raise
+
+
+class LocalInstagramScraper(InstagramScraper):
+    def __init__(self, base_url: str, client: HTTPClient):
+        self._base_url = base_url.rstrip("/")
+        self._client = client
+
+    def scrape(self, url: str, since: Optional[str] = None) -> List[Dict]:
+        try:
+            response = self._client.get(
+                f"{self._base_url}/instagram",
+                params={"url": url, "since": since or "", "limit": RESULTS_LIMIT},
+            )
+        except TransportError as e:
+            raise RetryableError(f"Scrape request failed: {e}") from e
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise RetryableError(
+                f"Scrape request returned {response.status_code}",
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+            )
+        response.raise_for_status()
+        return [mapping_fun(item) for item in response.json()]
+
+
+class LimitedInstagramScraper(InstagramScraper):
+    def __init__(self, scraper: InstagramScraper, limiter: AdaptiveLimiter):
+        self._scraper = scraper
+        self._limiter = limiter
+
+    def scrape(self, url: str, since: Optional[str] = None) -> List[Dict]:
+        return self._limiter.call(self._scraper.scrape, url, since=since)
+
+
+def create_scraper(settings: Settings) -> InstagramScraper:
+    if settings.scraper_provider == "apify":
+        scraper = ApifyInstagramScraper(settings.apify_api_token)
+    elif settings.scraper_provider == "local":
+        client = create_http_client("scraper", settings.scrape_workers, settings, settings.image_request_timeout)
+        scraper = LocalInstagramScraper(settings.local_provider_url, client)
+    else:
+        raise ValueError(f"Unknown scraper provider {settings.scraper_provider}")
+    return LimitedInstagramScraper(scraper, create_limiter("scraper", settings.scrape_workers, settings))
+
+
+_scraper: Optional[InstagramScraper] = None
+_scraper_lock = threading.Lock()
+
+
+def get_scraper() -> InstagramScraper:
+    global _scraper
+    with _scraper_lock:
+        if _scraper is None:
+            _scraper = create_scraper(settings)
+        return _scraper
+
+
+def scrape_instagram(url, since: Optional[str] = None) -> ScrapedProfile:
+    with metrics.timed("scrape"):
+        return ScrapedProfile.from_dicts(get_scraper().scrape(url, since=since))
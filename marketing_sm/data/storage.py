@@ -0,0 +1,645 @@
+"""
+This module defines the persistence backends used by `marketing_sm.business.model.State`.
+
+Instead of rewriting the whole state on every change, a `StateStore` persists each piece of a business separately:
+
+- the business itself, together with its colors;
+- each entry of a business (descriptions, suggestions and scraped Instagram profiles), identified by its kind and title.
+
+Mutations therefore only write the rows that changed, and the write cost does not depend on the number of businesses
+or scraped posts. Businesses are exchanged as plain dictionaries, in the same format used by `Business.from_dict`.
+
+Scraped profiles are `ScrapedProfile` instances (see `marketing_sm.data.posts`) and are persisted in their own binary
+encoding instead of JSON: as a BLOB in SQLite, in a separate `data` BYTEA column in PostgreSQL and base64-encoded in the
+journal and its snapshot. Profiles stored as JSON lists by previous versions are still loaded, and converted to the
+binary encoding the next time they are saved.
+
+### Backends
+
+- **`SQLiteStateStore`** (default): keeps the state in a SQLite database inside `DATA_DIR`.
+- **`JournalStateStore`**: keeps the state in a JSON snapshot plus an append-only journal of mutations. Mutations are
+  appended and fsynced to the journal (once per batch), and the journal is periodically compacted into a new snapshot, written to a
+  temporary file, fsynced and atomically renamed over the previous one. A crash can at most lose the last, partially
+  written journal line, which is ignored when the journal is replayed.
+- **`PostgresStateStore`**: keeps the state in PostgreSQL through a thread-safe connection pool, so that several
+  replicas of the application can share it. Whole-state saves are sent as batched upserts, and entries are looked up
+  through the `(business, kind, title)` index. It is `shared`, which tells `State` to read it again on refresh, as other
+  replicas may have changed it.
+
+Use `create_store(settings)` to build the backend selected in `Settings.state_backend`.
+
+### Coalescing writer
+
+`CoalescingStateStore` wraps a backend so that callers do not wait for the writes. Mutations are queued and persisted
+by a single background thread, which waits `delay` seconds to gather the writes of concurrent sessions and then saves
+them in one `save_changes` call (a single transaction in SQLite and PostgreSQL). Successive writes of the same business
+colors or entry are coalesced, and only the latest value is saved. Loads and `flush()` wait for the writes queued
+before them, so they always see the latest state, and `close()` flushes them before closing the backend. The changes
+of a failed batch are queued again (unless a newer write replaced them) and retried with a capped exponential backoff,
+so they are never dropped. While they are not saved, `flush()` (and thus every load) raises a `StateWriteError` instead
+of blocking while the backend is down, and so does `close()` if they still fail in its last attempt.
+"""
+
+import base64
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from marketing_sm.data.constants import (
+    DATA_DIR,
+    STATE_DB_FILENAME,
+    STATE_FILENAME,
+    STATE_JOURNAL_FILENAME,
+)
+from marketing_sm.data.posts import ScrapedProfile
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.settings import Settings
+
+logger = logging.getLogger()
+
+ENTRY_KINDS = ("descriptions", "suggestions", "instagram_urls")
+PROFILE_KIND = "instagram_urls"
+PROFILE_KEY = "profile"
+
+Entry = Tuple[str, str, str, Any]
+
+
+def _load_value(kind: str, value):
+    if kind == PROFILE_KIND:
+        return ScrapedProfile.from_value(value)
+    return value
+
+
+def _encode_profile(value):
+    # The journal is JSON, so it keeps the binary encoding of profiles in base64
+    if isinstance(value, ScrapedProfile):
+        return {PROFILE_KEY: base64.b64encode(value.encode()).decode("ascii")}
+    return value
+
+
+def _decode_profile(value):
+    if isinstance(value, dict) and PROFILE_KEY in value:
+        return base64.b64decode(value[PROFILE_KEY])
+    return value
+
+
+class StateStore(ABC):
+    shared: bool = False
+
+    @abstractmethod
+    def load_business_names(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def load_business(self, name: str) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def save_business(self, name: str, colors: List[str]):
+        pass
+
+    @abstractmethod
+    def save_entry(self, business: str, kind: str, title: str, value):
+        pass
+
+    def load_businesses(self) -> Dict[str, Dict]:
+        businesses = {}
+        for name in self.load_business_names():
+            business = self.load_business(name)
+            if business is not None:
+                businesses[name] = business
+        return businesses
+
+    def save_changes(self, businesses: Dict[str, List[str]], entries: List[Entry]):
+        for name, colors in businesses.items():
+            self.save_business(name, colors)
+        for business, kind, title, value in entries:
+            self.save_entry(business, kind, title, value)
+
+    def save_businesses(self, businesses: Dict[str, Dict]):
+        self.save_changes(
+            {name: business.get("colors", []) for name, business in businesses.items()},
+            [
+                (name, kind, title, entry["description"])
+                for name, business in businesses.items()
+                for kind in ENTRY_KINDS
+                for title, entry in business.get(kind, {}).items()
+            ],
+        )
+
+    def close(self):
+        pass
+
+
+class SQLiteStateStore(StateStore):
+    def __init__(self, filepath: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filepath, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS businesses ("
+                "name TEXT PRIMARY KEY, colors TEXT NOT NULL DEFAULT '[]')"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "business TEXT NOT NULL REFERENCES businesses(name), "
+                "kind TEXT NOT NULL, title TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (business, kind, title))"
+            )
+
+    def load_business_names(self) -> List[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name FROM businesses ORDER BY rowid"
+            ).fetchall()
+        return [name for name, in rows]
+
+    def load_business(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT colors FROM businesses WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return None
+            entries = self._connection.execute(
+                "SELECT kind, title, value FROM entries WHERE business = ? ORDER BY rowid",
+                (name,),
+            ).fetchall()
+        business = {"name": name, "colors": json.loads(row[0])}
+        business.update({kind: {} for kind in ENTRY_KINDS})
+        for kind, title, value in entries:
+            business.setdefault(kind, {})[title] = {
+                "title": title,
+                "description": _load_value(kind, value if isinstance(value, bytes) else json.loads(value)),
+            }
+        return business
+
+    def save_business(self, name: str, colors: List[str]):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO businesses (name, colors) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET colors = excluded.colors",
+                (name, json.dumps(colors)),
+            )
+
+    def save_entry(self, business: str, kind: str, title: str, value):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO entries (business, kind, title, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(business, kind, title) DO UPDATE SET value = excluded.value",
+                (business, kind, title, self._dump_value(value)),
+            )
+
+    def save_changes(self, businesses: Dict[str, List[str]], entries: List[Entry]):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO businesses (name, colors) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET colors = excluded.colors",
+                [(name, json.dumps(colors)) for name, colors in businesses.items()],
+            )
+            self._connection.executemany(
+                "INSERT INTO entries (business, kind, title, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(business, kind, title) DO UPDATE SET value = excluded.value",
+                [
+                    (business, kind, title, self._dump_value(value))
+                    for business, kind, title, value in entries
+                ],
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def _dump_value(value):
+        # Profiles are stored as BLOBs, which SQLite keeps as they are in the TEXT column
+        if isinstance(value, ScrapedProfile):
+            return value.encode()
+        return json.dumps(value)
+
+
+class JournalStateStore(StateStore):
+    def __init__(self, snapshot_path: str, journal_path: str, compact_every: int):
+        self._snapshot_path = snapshot_path
+        self._journal_path = journal_path
+        self._compact_every = compact_every
+        self._lock = threading.Lock()
+        self._businesses: Dict[str, Dict] = self._read_snapshot()
+        self._pending = self._replay_journal()
+        self._journal = open(journal_path, "a", encoding="utf-8")
+        if os.path.getsize(journal_path) > 0:
+            self._compact()
+
+    def load_business_names(self) -> List[str]:
+        with self._lock:
+            return list(self._businesses.keys())
+
+    def load_business(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            business = self._businesses.get(name)
+            business = json.loads(json.dumps(business)) if business is not None else None
+        if business is not None:
+            for kind in ENTRY_KINDS:
+                for entry in business.get(kind, {}).values():
+                    entry["description"] = _load_value(kind, _decode_profile(entry["description"]))
+        return business
+
+    def save_business(self, name: str, colors: List[str]):
+        self._append([self._business_mutation(name, colors)])
+
+    def save_entry(self, business: str, kind: str, title: str, value):
+        self._append([self._entry_mutation(business, kind, title, value)])
+
+    def save_changes(self, businesses: Dict[str, List[str]], entries: List[Entry]):
+        self._append(
+            [self._business_mutation(name, colors) for name, colors in businesses.items()]
+            + [self._entry_mutation(*entry) for entry in entries]
+        )
+
+    def close(self):
+        with self._lock:
+            self._compact()
+            self._journal.close()
+
+    @staticmethod
+    def _business_mutation(name: str, colors: List[str]) -> Dict:
+        return {"op": "business", "name": name, "colors": colors}
+
+    @staticmethod
+    def _entry_mutation(business: str, kind: str, title: str, value) -> Dict:
+        return {
+            "op": "entry",
+            "business": business,
+            "kind": kind,
+            "title": title,
+            "value": _encode_profile(value),
+        }
+
+    def _append(self, mutations: List[Dict]):
+        lines = "".join(json.dumps(mutation) + "\n" for mutation in mutations)
+        with self._lock:
+            for mutation in mutations:
+                self._apply(mutation)
+            self._journal.write(lines)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending += len(mutations)
+            if self._pending >= self._compact_every:
+                self._compact()
+
+    def _apply(self, mutation: Dict):
+        if mutation["op"] == "business":
+            business = self._businesses.setdefault(
+                mutation["name"], {"name": mutation["name"]}
+            )
+            business["colors"] = mutation["colors"]
+        elif mutation["op"] == "entry":
+            business = self._businesses.setdefault(
+                mutation["business"], {"name": mutation["business"], "colors": []}
+            )
+            business.setdefault(mutation["kind"], {})[mutation["title"]] = {
+                "title": mutation["title"],
+                "description": mutation["value"],
+            }
+
+    def _compact(self):
+        directory = os.path.dirname(self._snapshot_path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"businesses": self._businesses}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path)
+        _fsync_directory(directory)
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        os.fsync(self._journal.fileno())
+        self._pending = 0
+
+    def _read_snapshot(self) -> Dict[str, Dict]:
+        try:
+            with open(self._snapshot_path, "r", encoding="utf-8") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+        try:
+            return json.loads(data).get("businesses", {})
+        except json.JSONDecodeError:
+            corrupted_path = self._snapshot_path + str(time.time())
+            logger.error(f"Corrupted snapshot {self._snapshot_path}, moved to {corrupted_path}")
+            os.replace(self._snapshot_path, corrupted_path)
+            return {}
+
+    def _replay_journal(self) -> int:
+        replayed = 0
+        try:
+            with open(self._journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        mutation = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Ignoring incomplete journal entry in {self._journal_path}")
+                        break
+                    self._apply(mutation)
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        return replayed
+
+
+class PostgresStateStore(StateStore):
+    shared = True
+
+    def __init__(self, dsn: str, min_connections: int, max_connections: int):
+        self._pool = ThreadedConnectionPool(min_connections, max_connections, dsn)
+        with self._cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS businesses ("
+                "id BIGSERIAL UNIQUE, name TEXT PRIMARY KEY, "
+                "colors JSONB NOT NULL DEFAULT '[]'::jsonb)"
+            )
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id BIGSERIAL UNIQUE, "
+                "business TEXT NOT NULL REFERENCES businesses(name) ON DELETE CASCADE, "
+                "kind TEXT NOT NULL, title TEXT NOT NULL, value JSONB NOT NULL, "
+                "PRIMARY KEY (business, kind, title))"
+            )
+            cursor.execute("ALTER TABLE entries ADD COLUMN IF NOT EXISTS data BYTEA")
+
+    @contextmanager
+    def _cursor(self):
+        connection = self._pool.getconn()
+        try:
+            with connection:
+                with connection.cursor() as cursor:
+                    yield cursor
+        finally:
+            self._pool.putconn(connection)
+
+    def load_business_names(self) -> List[str]:
+        with self._cursor() as cursor:
+            cursor.execute("SELECT name FROM businesses ORDER BY id")
+            return [name for name, in cursor.fetchall()]
+
+    def load_business(self, name: str) -> Optional[Dict]:
+        with self._cursor() as cursor:
+            cursor.execute("SELECT colors FROM businesses WHERE name = %s", (name,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute(
+                "SELECT kind, title, value, data FROM entries WHERE business = %s ORDER BY id",
+                (name,),
+            )
+            entries = cursor.fetchall()
+        business = {"name": name, "colors": row[0]}
+        business.update({kind: {} for kind in ENTRY_KINDS})
+        for kind, title, value, data in entries:
+            business.setdefault(kind, {})[title] = {
+                "title": title,
+                "description": _load_value(kind, data if data is not None else value),
+            }
+        return business
+
+    def save_business(self, name: str, colors: List[str]):
+        with self._cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO businesses (name, colors) VALUES (%s, %s) "
+                "ON CONFLICT (name) DO UPDATE SET colors = EXCLUDED.colors",
+                (name, Json(colors)),
+            )
+
+    def save_entry(self, business: str, kind: str, title: str, value):
+        with self._cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO entries (business, kind, title, value, data) VALUES (%s, %s, %s, %s, %s) "
+                "ON CONFLICT (business, kind, title) "
+                "DO UPDATE SET value = EXCLUDED.value, data = EXCLUDED.data",
+                (business, kind, title, *self._dump_value(value)),
+            )
+
+    def save_changes(self, businesses: Dict[str, List[str]], entries: List[Entry]):
+        with self._cursor() as cursor:
+            if businesses:
+                execute_values(
+                    cursor,
+                    "INSERT INTO businesses (name, colors) VALUES %s "
+                    "ON CONFLICT (name) DO UPDATE SET colors = EXCLUDED.colors",
+                    [(name, Json(colors)) for name, colors in businesses.items()],
+                )
+            if entries:
+                execute_values(
+                    cursor,
+                    "INSERT INTO entries (business, kind, title, value, data) VALUES %s "
+                    "ON CONFLICT (business, kind, title) "
+                    "DO UPDATE SET value = EXCLUDED.value, data = EXCLUDED.data",
+                    [
+                        (business, kind, title, *self._dump_value(value))
+                        for business, kind, title, value in entries
+                    ],
+                )
+
+    def close(self):
+        self._pool.closeall()
+
+    @staticmethod
+    def _dump_value(value):
+        # Profiles are stored in the data column, value is then a JSON null
+        if isinstance(value, ScrapedProfile):
+            return Json(None), psycopg2.Binary(value.encode())
+        return Json(value), None
+
+
+class StateWriteError(Exception):
+    pass
+
+
+class CoalescingStateStore(StateStore):
+    def __init__(self, store: StateStore, delay: float, retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.store = store
+        self.delay = delay
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.writes: int = 0
+        self.coalesced: int = 0
+        self.failures: int = 0
+        # Changes are numbered as they are queued, and every pending change keeps the number of its latest write
+        self._businesses: Dict[str, Tuple[int, List[str]]] = {}
+        self._entries: Dict[Tuple[str, str, str], Tuple[int, Any]] = {}
+        self._queued = 0
+        self._in_flight: Optional[int] = None
+        self._error: Optional[Exception] = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._thread.start()
+        metrics.register_state_writer(type(store).__name__, self)
+
+    @property
+    def shared(self) -> bool:
+        return self.store.shared
+
+    @property
+    def pending(self) -> int:
+        return len(self._businesses) + len(self._entries)
+
+    def load_business_names(self) -> List[str]:
+        self.flush()
+        return self.store.load_business_names()
+
+    def load_business(self, name: str) -> Optional[Dict]:
+        self.flush()
+        return self.store.load_business(name)
+
+    def save_business(self, name: str, colors: List[str]):
+        with self._condition:
+            self._check_open()
+            if name in self._businesses:
+                self.coalesced += 1
+            self._queued += 1
+            self._businesses[name] = (self._queued, list(colors))
+            self._condition.notify_all()
+
+    def save_entry(self, business: str, kind: str, title: str, value):
+        with self._condition:
+            self._check_open()
+            if (business, kind, title) in self._entries:
+                self.coalesced += 1
+            self._queued += 1
+            self._entries[(business, kind, title)] = (self._queued, value)
+            self._condition.notify_all()
+
+    def save_changes(self, businesses: Dict[str, List[str]], entries: List[Entry]):
+        self.flush()
+        self.store.save_changes(businesses, entries)
+
+    def flush(self):
+        # Only the changes queued before the call are waited for, so that new writes cannot starve it
+        with self._condition:
+            target = self._queued
+            while True:
+                oldest = self._oldest_unsaved()
+                if oldest is None or oldest > target:
+                    return
+                if self._error is not None:
+                    raise StateWriteError(
+                        f"{self.pending} state changes are not saved yet: {self._error}"
+                    ) from self._error
+                self._condition.wait()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        unsaved = self.pending
+        self.store.close()
+        if unsaved:
+            raise StateWriteError(f"{unsaved} state changes were not saved: {self._error}") from self._error
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("The state store is closed")
+
+    def _oldest_unsaved(self) -> Optional[int]:
+        numbers = [number for number, _ in self._businesses.values()]
+        numbers += [number for number, _ in self._entries.values()]
+        if self._in_flight is not None:
+            numbers.append(self._in_flight)
+        return min(numbers, default=None)
+
+    def _run(self):
+        attempt = 0
+        while True:
+            with self._condition:
+                while not self.pending and not self._closed:
+                    self._condition.wait()
+                if not self.pending:
+                    return
+                closed = self._closed
+            if not closed and not attempt:
+                # Gather the writes of concurrent sessions into the same transaction
+                time.sleep(self.delay)
+            with self._condition:
+                businesses, self._businesses = self._businesses, {}
+                entries, self._entries = self._entries, {}
+                self._in_flight = self._oldest_unsaved()
+            changes = len(businesses) + len(entries)
+            try:
+                with metrics.timed("store_write"):
+                    self.store.save_changes(
+                        {name: colors for name, (_, colors) in businesses.items()},
+                        [(*key, value) for key, (_, value) in entries.items()],
+                    )
+            except Exception as e:
+                with self._condition:
+                    # The failed changes are queued again, unless a newer write of the same change was queued meanwhile
+                    for name, change in businesses.items():
+                        self._businesses.setdefault(name, change)
+                    for key, change in entries.items():
+                        self._entries.setdefault(key, change)
+                    self._in_flight = None
+                    self._error = e
+                    self.failures += 1
+                    closed = self._closed
+                    self._condition.notify_all()
+                if closed:
+                    logger.exception(f"Failed to save {changes} state changes before closing the store")
+                    return
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** attempt)
+                attempt += 1
+                logger.warning(f"Failed to save {changes} state changes ({e}), retrying in {delay:.1f}s")
+                deadline = time.monotonic() + delay
+                with self._condition:
+                    # New writes do not shorten the backoff, but closing the store interrupts it for a last attempt
+                    while not self._closed and time.monotonic() < deadline:
+                        self._condition.wait(deadline - time.monotonic())
+            else:
+                with self._condition:
+                    self._in_flight = None
+                    self._error = None
+                    self.writes += 1
+                    attempt = 0
+                    self._condition.notify_all()
+
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def create_store(settings: Settings) -> StateStore:
+    backend = settings.state_backend
+    os.makedirs(DATA_DIR, exist_ok=True)
+    logger.info(f"Using {backend} state backend")
+    if backend == "sqlite":
+        return SQLiteStateStore(os.path.join(DATA_DIR, STATE_DB_FILENAME))
+    if backend == "journal":
+        return JournalStateStore(
+            os.path.join(DATA_DIR, STATE_FILENAME),
+            os.path.join(DATA_DIR, STATE_JOURNAL_FILENAME),
+            compact_every=settings.state_journal_compact_every,
+        )
+    if backend == "postgres":
+        return PostgresStateStore(
+            settings.postgres_dsn,
+            settings.postgres_pool_min_connections,
+            settings.postgres_pool_max_connections,
+        )
+    raise ValueError(f"Unknown state backend {backend}")
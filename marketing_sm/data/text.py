@@ -0,0 +1,193 @@
+"""
+This module defines the interface of the text generation backends used by `TextGenerationPipeline`, selected with the
+`text_backend` setting:
+
+- `vertex` (default): `VertexTextBackend` streams the response of a Gemini model on Vertex AI. The Vertex AI SDK is only
+  imported and initialised when the backend is created, not when the module is imported.
+- `fake`: `FakeTextBackend` replays a recorded response (`fake_text_recording`), or synthetic `Posts` JSON, as a chunked
+  stream. It waits `fake_text_time_to_first_token` seconds before the first chunk and then emits chunks at
+  `fake_text_tokens_per_second`, which makes it possible to benchmark the pipeline offline with realistic timings.
+  Synthetic posts have `fake_text_images_per_post` images each, or between one and three when it is 0.
+
+`create_text_backend` wraps the backend in a `LimitedTextBackend`, which runs every request through an
+`AdaptiveLimiter` (see `marketing_sm.infrastructure.ratelimit`) with at most `text_concurrency` streams at once and at
+most `text_requests_per_minute` requests. Throttled requests (429 or 5xx) are retried with backoff, unless part of the
+response was already streamed. The time waited for the limiter is recorded as the `text_limiter_wait` stage, and the
+time to first token is measured from the moment the request is sent, so that it does not include the queueing.
+"""
+
+import json
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, Tuple
+
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.ratelimit import (
+    RETRYABLE_STATUS_CODES,
+    AdaptiveLimiter,
+    RetryableError,
+    create_limiter,
+)
+from marketing_sm.infrastructure.settings import Settings
+
+CHARS_PER_TOKEN = 4
+TOKENS_PER_CHUNK = 16
+TOTAL_POSTS_PATTERN = re.compile(r"a total of (\d+) posts")
+
+
+class TextBackend(ABC):
+    @property
+    @abstractmethod
+    def cache_params(self) -> Tuple:
+        pass
+
+    @abstractmethod
+    def stream(self, message: str, generation_config: Dict) -> Iterator[str]:
+        pass
+
+
+class VertexTextBackend(TextBackend):
+    def __init__(self, settings: Settings, system_instruction: str):
+        import vertexai
+        import vertexai.preview.generative_models as generative_models
+        from vertexai.generative_models import GenerativeModel
+
+        vertexai.init(project=settings.google_api_project, location=settings.google_location)
+        self._model_name = settings.google_text_model
+        self._model = GenerativeModel(
+            settings.google_text_model,
+            system_instruction=[system_instruction],
+        )
+        self._safety_settings = {
+            generative_models.HarmCategory.HARM_CATEGORY_HATE_SPEECH: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+            generative_models.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+            generative_models.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+            generative_models.HarmCategory.HARM_CATEGORY_HARASSMENT: generative_models.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        }
+
+    @property
+    def cache_params(self) -> Tuple:
+        return (self._model_name,)
+
+    def stream(self, message: str, generation_config: Dict) -> Iterator[str]:
+        from google.api_core.exceptions import GoogleAPICallError
+
+        try:
+            responses = self._model.generate_content(
+                [message],
+                generation_config=generation_config,
+                safety_settings=self._safety_settings,
+                stream=True,
+            )
+            for response in responses:
+                yield response.candidates[0].text
+        except GoogleAPICallError as e:
+            if e.code in RETRYABLE_STATUS_CODES:
+                raise RetryableError(f"Vertex AI returned {e.code}: {e.message}") from e
+            raise
+
+
+def synthetic_posts(total_posts: int, images_per_post: int = 0) -> str:
+    posts = []
+    for idx in range(total_posts):
+        images = images_per_post or 1 + idx % 3
+        posts.append(
+            {
+                "content_type": ["image", "carousel", "reel"][idx % 3],
+                "caption_image": [f"Título {idx + 1}.{image + 1}" for image in range(images)],
+                "post_caption": f"Descrição sintética do post {idx + 1}. " * 8,
+                "prompt_image": [
+                    f"A detailed synthetic background number {idx + 1}.{image + 1} in soft blue and white tones"
+                    for image in range(images)
+                ],
+            }
+        )
+    return "```json\n" + json.dumps({"posts": posts}, ensure_ascii=False, indent=2) + "\n```"
+
+
+class FakeTextBackend(TextBackend):
+    def __init__(
+        self,
+        tokens_per_second: float,
+        time_to_first_token: float,
+        recording: str = "",
+        images_per_post: int = 0,
+    ):
+        self.tokens_per_second = tokens_per_second
+        self.time_to_first_token = time_to_first_token
+        self.images_per_post = images_per_post
+        self._recording = None
+        if recording:
+            with open(recording, "r", encoding="utf-8") as f:
+                self._recording = f.read()
+
+    @property
+    def cache_params(self) -> Tuple:
+        return ("fake", self._recording, self.images_per_post)
+
+    def stream(self, message: str, generation_config: Dict) -> Iterator[str]:
+        text = self._recording
+        if text is None:
+            match = TOTAL_POSTS_PATTERN.search(message)
+            text = synthetic_posts(int(match.group(1)) if match else 1, self.images_per_post)
+
+        chunk_size = TOKENS_PER_CHUNK * CHARS_PER_TOKEN
+        time.sleep(self.time_to_first_token)
+        for start in range(0, len(text), chunk_size):
+            if start:
+                time.sleep(TOKENS_PER_CHUNK / self.tokens_per_second)
+            yield text[start: start + chunk_size]
+
+
+class LimitedTextBackend(TextBackend):
+    def __init__(self, backend: TextBackend, limiter: AdaptiveLimiter):
+        self.backend = backend
+        self._limiter = limiter
+
+    @property
+    def cache_params(self) -> Tuple:
+        return self.backend.cache_params
+
+    def stream(self, message: str, generation_config: Dict) -> Iterator[str]:
+        attempt = 0
+        while True:
+            with metrics.timed("text_limiter_wait"):
+                started_at = self._limiter.acquire()
+            request_start = time.perf_counter()
+            streamed = False
+            try:
+                for chunk in self.backend.stream(message, generation_config):
+                    if not streamed:
+                        metrics.observe("time_to_first_token", time.perf_counter() - request_start)
+                    streamed = True
+                    yield chunk
+            except RetryableError as e:
+                self._limiter.throttle(started_at)
+                if streamed or not self._limiter.retry(attempt, e):
+                    raise
+                attempt += 1
+            except BaseException:
+                self._limiter.release(success=False)
+                raise
+            else:
+                self._limiter.release()
+                return
+
+
+def create_text_backend(settings: Settings, system_instruction: str) -> TextBackend:
+    if settings.text_backend == "vertex":
+        backend = VertexTextBackend(settings, system_instruction)
+    elif settings.text_backend == "fake":
+        backend = FakeTextBackend(
+            settings.fake_text_tokens_per_second,
+            settings.fake_text_time_to_first_token,
+            settings.fake_text_recording,
+            settings.fake_text_images_per_post,
+        )
+    else:
+        raise ValueError(f"Unknown text backend {settings.text_backend}")
+    limiter = create_limiter(
+        "text", settings.text_concurrency, settings, settings.text_requests_per_minute
+    )
+    return LimitedTextBackend(backend, limiter)
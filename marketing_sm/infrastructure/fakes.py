@@ -0,0 +1,210 @@
+"""
+This module provides a local stand-in for the external services used by the application, so that the pipeline can be
+benchmarked and regression tested offline, without costs or rate limits.
+
+`FakeProvidersServer` is a small threaded HTTP server exposing:
+
+- `/prompt/<prompt>` (GET or POST): mimics the Pollinations AI API and returns a synthetic PNG whose colors are derived
+  from a hash of the prompt, so the same prompt always returns the same image.
+- `/instagram?url=<url>&since=<date>&limit=<n>`: returns Apify-like Instagram dataset items, generated from a seed
+  derived from the profile URL, optionally restricted to the posts newer than `since`.
+
+Every request waits for `latency` seconds (plus a random `jitter`) before answering, and fails with `error_status` with
+probability `error_rate`.
+
+To use it, start the server and point the application to it:
+
+    python -m marketing_sm.infrastructure.fakes --port 8001 --latency 0.5 --error-rate 0.05
+    IMAGE_PROVIDER_URL=http://localhost:8001/prompt SCRAPER_PROVIDER=local LOCAL_PROVIDER_URL=http://localhost:8001
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+logger = logging.getLogger()
+
+DATASET_END = datetime.datetime(2024, 12, 31, 12, tzinfo=datetime.timezone.utc)
+HASHTAGS = ["marketing", "smallbusiness", "portugal", "lisboa", "porto", "promo", "dicas", "novidades"]
+WORDS = ["loja", "produto", "cliente", "semana", "oferta", "novo", "qualidade", "equipa", "local", "feito", "mão"]
+
+
+def _seed(value: str) -> int:
+    return int.from_bytes(hashlib.sha256(value.encode("utf-8")).digest()[:8], "big")
+
+
+def synthetic_png(prompt: str, size: int) -> bytes:
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    top, bottom = digest[:3], digest[3:6]
+    rows = []
+    for y in range(size):
+        color = bytes(
+            top[channel] + (bottom[channel] - top[channel]) * y // max(size - 1, 1)
+            for channel in range(3)
+        )
+        rows.append(b"\x00" + color * size)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"".join(rows)))
+        + chunk(b"IEND", b"")
+    )
+
+
+def synthetic_dataset(url: str, limit: int, since: Optional[str] = None) -> List[Dict]:
+    rng = random.Random(_seed(url))
+    items = []
+    timestamp = DATASET_END
+    for _ in range(limit):
+        timestamp -= datetime.timedelta(hours=rng.randint(12, 96))
+        date = timestamp.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        if since and date[: len(since)] <= since:
+            break
+        hashtags = rng.sample(HASHTAGS, rng.randint(0, 4))
+        caption = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40)))
+        items.append(
+            {
+                "caption": caption + "".join(f" #{hashtag}" for hashtag in hashtags),
+                "alt": rng.choice([None, "Photo by " + url]),
+                "commentsCount": rng.randint(0, 50),
+                "hashtags": hashtags,
+                "images": [f"{url.rstrip('/')}/p/{rng.getrandbits(40):x}.jpg"],
+                "likesCount": rng.randint(0, 2000),
+                "timestamp": date,
+            }
+        )
+    return items
+
+
+class FakeProvidersServer:
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8001,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        image_size: int = 256,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.image_size = image_size
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeProvidersServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def _next_random(self) -> float:
+        with self._random_lock:
+            return self._random.random()
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _handle(self):
+                time.sleep(fake.latency + fake.jitter * fake._next_random())
+                if fake._next_random() < fake.error_rate:
+                    self._send(fake.error_status, b"Injected error", "text/plain")
+                    return
+
+                request = urlparse(self.path)
+                if request.path.startswith("/prompt/"):
+                    prompt = unquote(request.path[len("/prompt/"):])
+                    self._send(200, synthetic_png(prompt, fake.image_size), "image/png")
+                elif request.path == "/instagram":
+                    query = parse_qs(request.query)
+                    items = synthetic_dataset(
+                        query.get("url", [""])[0],
+                        int(query.get("limit", ["200"])[0]),
+                        query.get("since", [""])[0] or None,
+                    )
+                    self._send(200, json.dumps(items).encode("utf-8"), "application/json")
+                else:
+                    self._send(404, b"Not found", "text/plain")
+
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Pollinations and Apify providers")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum extra random latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of failing a request")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--image-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeProvidersServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        image_size=args.image_size,
+        seed=args.seed,
+    )
+    logger.info(f"Serving fake providers on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+This module provides the pooled HTTP client shared by the HTTP providers (images and the local scraper), so that
+connections are kept alive and reused between requests instead of paying a new TCP and TLS handshake for every one.
+
+`HTTPClient` wraps a `requests.Session` whose connection pool holds up to `pool_size` connections per host, usually the
+concurrency of the provider. When `http2` is set and `httpx` (with its `http2` extra) is installed, an `httpx.Client`
+is used instead, which multiplexes the requests over HTTP/2 connections; otherwise it falls back to `requests`.
+
+Every request has a connect and a read timeout. Transport failures (connection errors and timeouts) are raised as
+`TransportError`, and any other failure of the request as `HTTPClientError`, whatever the library used.
+
+The clients created with `create_http_client` are registered in `marketing_sm.infrastructure.metrics`, which exports
+the number of requests sent by every client, and the number of connections opened by its current `requests` pools:
+their ratio shows how well connections are reused. The latter is a gauge, as the pool of a host is discarded (with its
+count) when too many hosts are used.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.settings import Settings
+
+logger = logging.getLogger()
+
+
+class HTTPClientError(Exception):
+    pass
+
+
+class TransportError(HTTPClientError):
+    pass
+
+
+def _load_httpx():
+    try:
+        import h2  # noqa: F401
+        import httpx
+    except ImportError:
+        return None
+    return httpx
+
+
+class HTTPClient:
+    def __init__(
+        self,
+        pool_size: int,
+        connect_timeout: float,
+        read_timeout: float,
+        http2: bool = False,
+    ):
+        self.pool_size = pool_size
+        self.requests_sent: int = 0
+        self._lock = threading.Lock()
+        self._httpx = _load_httpx() if http2 else None
+        if http2 and self._httpx is None:
+            logger.warning("HTTP/2 requires httpx[http2], falling back to HTTP/1.1 with requests")
+
+        if self._httpx is not None:
+            self._client = self._httpx.Client(
+                http2=True,
+                timeout=self._httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=self._httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                ),
+            )
+        else:
+            self._timeout = (connect_timeout, read_timeout)
+            self._adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=0)
+            self._client = requests.Session()
+            self._client.mount("http://", self._adapter)
+            self._client.mount("https://", self._adapter)
+
+    @property
+    def http2(self) -> bool:
+        return self._httpx is not None
+
+    def request(self, method: str, url: str, params: Optional[Dict] = None):
+        with self._lock:
+            self.requests_sent += 1
+        if self._httpx is not None:
+            try:
+                return self._client.request(method, url, params=params)
+            except self._httpx.TransportError as e:
+                raise TransportError(str(e)) from e
+            except self._httpx.HTTPError as e:
+                raise HTTPClientError(str(e)) from e
+        try:
+            return self._client.request(method, url, params=params, timeout=self._timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise TransportError(str(e)) from e
+        except requests.RequestException as e:
+            raise HTTPClientError(str(e)) from e
+
+    def get(self, url: str, params: Optional[Dict] = None):
+        return self.request("GET", url, params=params)
+
+    def post(self, url: str, params: Optional[Dict] = None):
+        return self.request("POST", url, params=params)
+
+    def connections(self) -> Optional[int]:
+        if self._httpx is not None:
+            # httpx does not count the connections it opened
+            return None
+        pools = self._adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def close(self):
+        self._client.close()
+
+
+def create_http_client(name: str, pool_size: int, settings: Settings, read_timeout: float) -> HTTPClient:
+    client = HTTPClient(
+        pool_size,
+        connect_timeout=settings.http_connect_timeout,
+        read_timeout=read_timeout,
+        http2=settings.http2,
+    )
+    metrics.register_http_client(name, client)
+    return client
@@ -0,0 +1,237 @@
+"""
+This module implements a minimal, dependency free metrics registry rendered in the Prometheus text exposition format,
+which is served on `/metrics` next to the Gradio app (see `marketing_sm.presentation.server`).
+
+### Metrics
+
+- `marketing_sm_stage_seconds{stage}`: histogram of the duration of each stage of the pipeline (prompt rendering,
+  limiter wait, time to first token, streaming, parsing, image requests, scraping, state writes, UI updates...).
+  Stages are timed with the `timed(stage)` context manager or recorded with `observe(stage, seconds)`.
+- `marketing_sm_tokens_total{kind}`: estimated prompt and completion tokens.
+- `marketing_sm_image_bytes_downloaded_total`: bytes downloaded from the image provider.
+- `marketing_sm_cache_requests_total{cache, result}` and `marketing_sm_cache_bytes{cache}`: hits, misses and size of
+  the registered `DiskCache` instances, collected when the metrics are rendered.
+- `marketing_sm_limiter_concurrency{limiter}`, `marketing_sm_limiter_in_flight{limiter}`,
+  `marketing_sm_limiter_throttled_total{limiter}` and `marketing_sm_limiter_retries_total{limiter}`: state of the
+  registered `AdaptiveLimiter` instances of the external providers.
+- `marketing_sm_http_requests_total{client}` and `marketing_sm_http_pool_connections{client}`: requests sent by the
+  registered `HTTPClient` instances, and connections opened by the pools they currently keep (a gauge, since the pools
+  of the hosts that are no longer used are discarded with their count).
+- `marketing_sm_state_pending_writes{store}`, `marketing_sm_state_writes_total{store}`,
+  `marketing_sm_state_write_failures_total{store}` and `marketing_sm_state_coalesced_writes_total{store}`: changes
+  waiting in the `CoalescingStateStore`, batches written, failed batch writes (retried) and changes replaced by a newer
+  one before being written.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(labels)} {value}" for labels, value in values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._values: Dict[Labels, Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[idx] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', str(bound)),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collector in self._collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram("marketing_sm_stage_seconds", "Duration of each stage of the pipeline in seconds.")
+)
+TOKENS = REGISTRY.register(
+    Counter("marketing_sm_tokens_total", "Estimated number of prompt and completion tokens.")
+)
+IMAGE_BYTES = REGISTRY.register(
+    Counter("marketing_sm_image_bytes_downloaded_total", "Bytes downloaded from the image provider.")
+)
+
+_caches = {}
+_limiters = {}
+_http_clients = {}
+_state_writers = {}
+
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def register_cache(name: str, cache):
+    _caches[name] = cache
+
+
+def register_limiter(name: str, limiter):
+    _limiters[name] = limiter
+
+
+def register_http_client(name: str, client):
+    _http_clients[name] = client
+
+
+def register_state_writer(name: str, writer):
+    _state_writers[name] = writer
+
+
+def _collect_caches() -> List[str]:
+    lines = [
+        "# HELP marketing_sm_cache_requests_total Cache lookups by result.",
+        "# TYPE marketing_sm_cache_requests_total counter",
+    ]
+    sizes = [
+        "# HELP marketing_sm_cache_bytes Size of the cache entries in bytes.",
+        "# TYPE marketing_sm_cache_bytes gauge",
+    ]
+    for name, cache in _caches.items():
+        stats = cache.stats()
+        for result in ("hits", "misses"):
+            lines.append(
+                f"marketing_sm_cache_requests_total{_format_labels((('cache', name), ('result', result)))} {stats[result]}"
+            )
+        sizes.append(f"marketing_sm_cache_bytes{_format_labels((('cache', name),))} {stats['bytes']}")
+    return lines + sizes
+
+
+def _collect_limiters() -> List[str]:
+    lines = []
+    for metric, kind, documentation, attribute in (
+        ("marketing_sm_limiter_concurrency", "gauge", "Current concurrency limit.", "limit"),
+        ("marketing_sm_limiter_in_flight", "gauge", "Calls in flight.", "in_flight"),
+        ("marketing_sm_limiter_throttled_total", "counter", "Calls throttled by the provider.", "throttled"),
+        ("marketing_sm_limiter_retries_total", "counter", "Retried calls.", "retries"),
+    ):
+        lines += [f"# HELP {metric} {documentation}", f"# TYPE {metric} {kind}"]
+        for name, limiter in _limiters.items():
+            lines.append(f"{metric}{_format_labels((('limiter', name),))} {getattr(limiter, attribute)}")
+    return lines
+
+
+def _collect_http_clients() -> List[str]:
+    requests = [
+        "# HELP marketing_sm_http_requests_total Requests sent by the HTTP client.",
+        "# TYPE marketing_sm_http_requests_total counter",
+    ]
+    connections = [
+        "# HELP marketing_sm_http_pool_connections Connections opened by the current pools of the HTTP client.",
+        "# TYPE marketing_sm_http_pool_connections gauge",
+    ]
+    for name, client in _http_clients.items():
+        labels = _format_labels((("client", name),))
+        requests.append(f"marketing_sm_http_requests_total{labels} {client.requests_sent}")
+        opened = client.connections()
+        if opened is not None:
+            connections.append(f"marketing_sm_http_pool_connections{labels} {opened}")
+    return requests + connections
+
+
+def _collect_state_writers() -> List[str]:
+    lines = []
+    for metric, kind, documentation, attribute in (
+        ("marketing_sm_state_pending_writes", "gauge", "State changes waiting to be written.", "pending"),
+        ("marketing_sm_state_writes_total", "counter", "Batches of state changes written.", "writes"),
+        ("marketing_sm_state_write_failures_total", "counter", "Failed writes of state changes.", "failures"),
+        (
+            "marketing_sm_state_coalesced_writes_total",
+            "counter",
+            "State changes replaced before being written.",
+            "coalesced",
+        ),
+    ):
+        lines += [f"# HELP {metric} {documentation}", f"# TYPE {metric} {kind}"]
+        for name, writer in _state_writers.items():
+            lines.append(f"{metric}{_format_labels((('store', name),))} {getattr(writer, attribute)}")
+    return lines
+
+
+REGISTRY.register_collector(_collect_caches)
+REGISTRY.register_collector(_collect_limiters)
+REGISTRY.register_collector(_collect_http_clients)
+REGISTRY.register_collector(_collect_state_writers)
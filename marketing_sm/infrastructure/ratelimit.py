@@ -0,0 +1,187 @@
+"""
+This module implements the rate limiters used to stay within the quotas of the external services.
+
+`RateLimiter` is a thread safe token bucket: it is refilled with `rate` tokens per second up to `capacity` tokens, and
+`acquire(tokens)` blocks until enough tokens are available, takes them and returns the seconds it waited. With a
+capacity of one, requests are evenly spaced at `rate` per second, which keeps a per-minute quota saturated without
+bursting over it.
+
+`AdaptiveLimiter` wraps the calls to a provider. It limits their concurrency with an AIMD (additive increase,
+multiplicative decrease) policy, optionally spaces them with a `RateLimiter`, and retries them when they fail with a
+`RetryableError` (raised by the providers on 429 and 5xx responses and on connection errors):
+
+- every successful call raises the concurrency limit by `1 / limit`, so it grows by about one per round of calls, up
+  to `max_concurrency`. Calls failing with other errors leave it unchanged;
+- a throttled call multiplies the limit by `decrease_factor`, down to `min_concurrency`. Only calls started after the
+  previous decrease can decrease it again, so a burst of errors from the same round only counts once;
+- throttled calls are retried up to `max_attempts` times, after the `Retry-After` delay sent by the provider or an
+  exponential backoff with full jitter (a random delay between 0 and `base_delay * 2 ** attempt`, up to `max_delay`).
+
+`create_limiter` builds an `AdaptiveLimiter` from the retry settings and registers it in the metrics.
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.settings import Settings
+
+logger = logging.getLogger()
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RetryableError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError(f"The rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests: float, capacity: float = 1.0) -> "RateLimiter":
+        return cls(requests / 60.0, capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of capacity {self.capacity}")
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        decrease_factor: float = 0.5,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.decrease_factor = decrease_factor
+        self.limit: float = float(max_concurrency)
+        self.in_flight: int = 0
+        self.throttled: int = 0
+        self.retries: int = 0
+        self._rate_limiter = rate_limiter
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+        return time.monotonic()
+
+    def release(self, success: bool = True):
+        with self._condition:
+            self.in_flight -= 1
+            if success:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def throttle(self, started_at: float):
+        with self._condition:
+            self.in_flight -= 1
+            self.throttled += 1
+            if started_at >= self._decreased_at:
+                limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                if int(limit) < int(self.limit):
+                    logger.warning(f"{self.name} is throttled, concurrency limit lowered to {int(limit)}")
+                self.limit = limit
+                self._decreased_at = time.monotonic()
+            self._condition.notify_all()
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def retry(self, attempt: int, error: RetryableError) -> bool:
+        if attempt + 1 >= self.max_attempts:
+            return False
+        delay = self.backoff(attempt, error.retry_after)
+        logger.info(f"{self.name} call failed ({error}), retrying in {delay:.1f} seconds")
+        with self._condition:
+            self.retries += 1
+        time.sleep(delay)
+        return True
+
+    def call(self, function: Callable[..., T], *args, **kwargs) -> T:
+        attempt = 0
+        while True:
+            started_at = self.acquire()
+            try:
+                result = function(*args, **kwargs)
+            except RetryableError as e:
+                self.throttle(started_at)
+                if not self.retry(attempt, e):
+                    raise
+                attempt += 1
+            except BaseException:
+                self.release(success=False)
+                raise
+            else:
+                self.release()
+                return result
+
+
+def create_limiter(
+    name: str, max_concurrency: int, settings: Settings, requests_per_minute: float = 0.0
+) -> AdaptiveLimiter:
+    limiter = AdaptiveLimiter(
+        name,
+        max_concurrency,
+        rate_limiter=RateLimiter.per_minute(requests_per_minute) if requests_per_minute > 0 else None,
+        max_attempts=settings.retry_max_attempts,
+        base_delay=settings.retry_base_delay,
+        max_delay=settings.retry_max_delay,
+    )
+    metrics.register_limiter(name, limiter)
+    return limiter
@@ -8,6 +8,10 @@ This script performs the following initialization tasks for the application:
 5. Launches the Gradio interface, which provides a web-based graphical user interface for user interaction.
 
 The Gradio interface allows users to interact with the application through a web-based GUI.
+
+Only what is needed to serve the interface is done before the server binds its port: the text generation pipeline,
+the examples index and the scraper client are created on first use, and the first two are warmed up in a background
+thread once the server has started, so the first request does not pay for them.
 """
 
 import logging
@@ -21,21 +25,31 @@ from marketing_sm.presentation.interface import Interface
 from marketing_sm.presentation.language import PortugueseLanguage
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
-# Ensure the data directory exists
-os.makedirs(DATA_DIR, exist_ok=True)
 
-# Remove all handlers associated with the root logger object
-for handler in logger.handlers[:]:
-    logger.removeHandler(handler)
+def configure_logging():
+    logger.setLevel(logging.INFO)
+
+    # Remove all handlers associated with the root logger object
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+
+    # Console handler
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.INFO)
+    logger.addHandler(ch)
+
+
+def main():
+    configure_logging()
+
+    # Ensure the data directory exists
+    os.makedirs(DATA_DIR, exist_ok=True)
 
-# Console handler
-ch = logging.StreamHandler()
-ch.setLevel(logging.INFO)
-logger.addHandler(ch)
+    state = load_state()
+    interface = Interface(gr, state, language=PortugueseLanguage())
+    interface.launch()
 
-state = load_state()
-INTERFACE: Interface = Interface(gr, state, language=PortugueseLanguage())
 
-INTERFACE.launch()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+This script generates the Instagram posts of many businesses and months at once, without the Gradio interface.
+
+For every pair of business (by default, every business in the state) and month, `TextGenerationPipeline.create_posts`
+is run with the latest description, the colors and the examples from the scraped profiles of the business, as the
+interface does. The campaigns run concurrently on `batch_workers` threads, and the requests to the text model are
+limited to `text_concurrency` at once and spaced at `text_requests_per_minute` (see `marketing_sm.data.text`), so the
+quota is kept busy without being exceeded. Responses replayed from the cache do not count against the limit.
+
+Every campaign is written to `<output>/<business>/<month>/`, named after the business and the month followed by a short
+hash of their exact names, so that names differing only in case or punctuation do not share a directory. The images
+(copies of the original files returned by the image provider) are written first and then `posts.json`, which is written
+atomically and acts as the checkpoint. Campaigns whose `posts.json` already exists are skipped, so an interrupted run
+can be resumed by running the same command again (use `--overwrite` to generate them again).
+
+Usage:
+
+    python -m marketing_sm.presentation.batch --months Janeiro Fevereiro --businesses "Loja A" "Loja B"
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from PIL import Image
+
+from marketing_sm.business.model import Business, State, load_state
+from marketing_sm.data.constants import CAMPAIGNS_DIR, DATA_DIR
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.settings import get_settings
+
+settings = get_settings()
+
+logger = logging.getLogger()
+
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+POSTS_FILENAME = "posts.json"
+IMAGE_EXTENSIONS = {"JPEG": ".jpg"}
+
+
+def slugify(value: str) -> str:
+    # Names that only differ in case or punctuation ("Loja A" and "loja-a") keep distinct directories
+    readable = re.sub(r"[^\w]+", "-", value).strip("-").lower() or "unnamed"
+    return f"{readable}-{hashlib.sha256(value.encode('utf-8')).hexdigest()[:8]}"
+
+
+def campaign_directory(output_dir: str, business: str, month: str) -> str:
+    return os.path.join(output_dir, slugify(business), slugify(month))
+
+
+def business_examples(examples, business: Business, month: str, suggestions: str, description: str) -> List[Dict]:
+    found = []
+    for url, profile in business.instagram_urls.items():
+        try:
+            with metrics.timed("retrieve_examples"):
+                found += examples.relevant_examples(
+                    business.name,
+                    url,
+                    profile.description,
+                    query=f"{month} {suggestions} {description}",
+                    top_k=settings.examples_top_k,
+                )
+        except Exception:
+            # The examples are then truncated to the token budget in the order of the profile, newest first
+            logger.exception(f"Failed to retrieve the examples of {url}, using the scraped posts instead")
+            found += profile.description.to_dicts()
+    return found
+
+
+def image_extension(path: str) -> str:
+    with Image.open(path) as image:
+        image_format = image.format or ""
+    return IMAGE_EXTENSIONS.get(image_format, "." + image_format.lower())
+
+
+def save_campaign(directory: str, posts: Dict):
+    os.makedirs(directory, exist_ok=True)
+    for idx_post, post in enumerate(posts["posts"]):
+        filenames = []
+        for idx_image, image in enumerate(post.pop("images", [])):
+            filename = f"image-{idx_post + 1}-{idx_image + 1}{image_extension(image.path)}"
+            shutil.copyfile(image.path, os.path.join(directory, filename))
+            filenames.append(filename)
+        post["images"] = filenames
+
+    filepath = os.path.join(directory, POSTS_FILENAME)
+    with open(filepath + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(posts, f, ensure_ascii=False, indent=2)
+    os.replace(filepath + ".tmp", filepath)
+
+
+def generate_campaign(state: State, pipeline, examples, month: str, business_name: str, args) -> str:
+    directory = campaign_directory(args.output, business_name, month)
+    if not args.overwrite and os.path.exists(os.path.join(directory, POSTS_FILENAME)):
+        logger.info(f"Skipping {business_name} {month}, already generated in {directory}")
+        return SKIPPED
+
+    business = state.businesses[business_name]
+    description = list(business.descriptions.values())[-1].description if business.descriptions else ""
+    try:
+        posts = pipeline.create_posts(
+            business=business_name,
+            business_examples=business_examples(examples, business, month, args.suggestions, description),
+            business_description=description,
+            suggestions=args.suggestions,
+            month=month,
+            total_posts=args.edu_posts + args.mot_posts + args.int_posts + args.sell_posts,
+            edu_posts=args.edu_posts,
+            mot_posts=args.mot_posts,
+            int_posts=args.int_posts,
+            sell_posts=args.sell_posts,
+            colors=[color for color in business.colors if color],
+            use_cache=not args.fresh_posts,
+        )
+        save_campaign(directory, posts)
+    except Exception:
+        logger.exception(f"Failed to generate the posts of {business_name} for {month}")
+        return FAILED
+    logger.info(f"Generated {len(posts['posts'])} posts of {business_name} for {month} in {directory}")
+    return DONE
+
+
+def run_batch(state: State, businesses: List[str], months: List[str], args) -> Dict[str, int]:
+    from marketing_sm.business.ai import TextGenerationPipeline
+    from marketing_sm.data.examples import ExamplesIndex
+
+    pipeline = TextGenerationPipeline()
+    examples = ExamplesIndex()
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="campaign") as executor:
+        futures = [
+            executor.submit(generate_campaign, state, pipeline, examples, month, business, args)
+            for month in months
+            for business in businesses
+        ]
+        statuses = [future.result() for future in futures]
+    return {status: statuses.count(status) for status in (DONE, SKIPPED, FAILED)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the posts of many businesses and months at once")
+    parser.add_argument("--months", nargs="+", required=True, help="Months to generate, as shown in the interface")
+    parser.add_argument("--businesses", nargs="+", default=None, help="Businesses to generate (default: all)")
+    parser.add_argument("--output", default=os.path.join(DATA_DIR, CAMPAIGNS_DIR))
+    parser.add_argument("--suggestions", default="")
+    parser.add_argument("--edu-posts", type=int, default=3)
+    parser.add_argument("--mot-posts", type=int, default=3)
+    parser.add_argument("--int-posts", type=int, default=3)
+    parser.add_argument("--sell-posts", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=settings.batch_workers)
+    parser.add_argument("--fresh-posts", action="store_true", help="Do not replay cached responses")
+    parser.add_argument("--overwrite", action="store_true", help="Generate again the campaigns already on disk")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    state = load_state()
+    businesses = args.businesses or list(state.businesses.keys())
+    unknown = [business for business in businesses if business not in state.businesses]
+    if unknown:
+        parser.error(f"Unknown businesses: {', '.join(unknown)}")
+
+    summary = run_batch(state, businesses, args.months, args)
+    logger.info(f"Batch finished: {summary}")
+    if summary[FAILED]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 """
 This module sets up and manages a Gradio-based user interface for handling business data and generating Instagram posts. It performs the following key functions:
 
-1. **State Management**: Utilizes a `State` dataclass to manage and persist business information, including descriptions, Instagram profiles, and post configurations. This state is loaded from and saved to a JSON file.
+1. **State Management**: Utilizes a `State` dataclass to manage and persist business information, including descriptions, Instagram profiles, and post configurations. Every change is persisted through the state's store, which only writes the modified business data.
+   A single `Interface` and `State` serve every browser session, and Gradio runs up to `ui_concurrency` handlers at once: changes are made while holding the lock of their business, so sessions working on different businesses do not wait for each other, and they are written by the single background writer of the store.
 
 2. **UI Initialization**: Creates and configures various Gradio UI components such as dropdowns, textboxes, sliders, color pickers, and buttons. These components are used for inputting and managing business data, Instagram profiles, post content, and configuration settings.
 
@@ -10,35 +11,53 @@ This module sets up and manages a Gradio-based user interface for handling busin
    - **Descriptions**: Manages business descriptions, including adding new descriptions and selecting existing ones.
 
 4. **Instagram Profile Management**:
-   - **Adding New Profiles**: Allows users to add new Instagram profiles and scrape data from them.
+   - **Adding New Profiles**: Allows users to add new Instagram profiles and scrape data from them. Scraping runs as a background job in a persistent `JobQueue`, so the handler returns immediately; the job status is polled and shown in the UI, and the profile becomes selectable once its job is done.
+     The "init date" calendar limits the first scrape to posts newer than the chosen date.
+   - **Refreshing Profiles**: Re-scrapes an existing profile incrementally, asking only for the posts newer than the latest stored one and merging them into the stored dataset.
    - **Handling URLs**: Updates the UI based on the selected Instagram profile.
 
 5. **Post Generation**:
    - **Creating Posts**: Generates Instagram post content based on various inputs such as business details, post type, and colors. Uses a model to create post captions and fetch related images.
+     Only the scraped posts most relevant to the request (and with the highest engagement) are sent as examples, retrieved from the `ExamplesIndex`. If the retrieval fails, the scraped posts are used instead, newest first.
+     The handler is a generator: every post is shown as soon as the model finishes writing it, and its gallery is filled in as the images arrive.
+     Galleries receive the paths of the cached thumbnails, which are served as files instead of being re-encoded on every update.
+     The text generation pipeline and the examples index are heavy to import and initialise, so they are only created on first use (or by `warm_up()`, which runs in the background once the server has started).
    - **Configuration**: Provides sliders and inputs for configuring the number and type of posts (educational, motivational, interactive, selling) and ensures the total number of posts is accurate.
 
 6. **UI Interaction**:
    - **Dynamic Updates**: Updates UI components dynamically based on user interactions, such as changing the number of colors or adjusting post configurations.
    - **Refresh Functionality**: Refreshes the business options and updates the UI accordingly.
 
-7. **Launch**: Configures and starts the Gradio interface, allowing users to interact with the application through a web-based GUI.
+7. **Launch**: Configures and starts the Gradio interface, allowing users to interact with the application through a web-based GUI. The interface is served together with a Prometheus `/metrics` endpoint exposing the latency of every stage of the post generation.
 
 This module integrates with various components to create a cohesive interface for managing business data and generating content, providing a complete solution for interacting with and configuring Instagram posts.
 """
 
 import logging
+import os
+import threading
+import time
+from concurrent.futures import as_completed
 
 from gradio_calendar import Calendar
 
-from marketing_sm.business.model import State, Business, Description
-from marketing_sm.business.ai import TextGenerationPipeline
-from marketing_sm.data.scraper import scrape_instagram
+from marketing_sm.business.model import State, Description
+from marketing_sm.business.jobs import JobQueue
+from marketing_sm.data.constants import DATA_DIR, JOBS_DB_FILENAME, THUMBNAIL_CACHE_DIR
+from marketing_sm.data.posts import ScrapedProfile
+from marketing_sm.data.scraper import latest_post_date, merge_posts, scrape_instagram
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.settings import get_settings
 from marketing_sm.presentation.language import LanguageFactory
+from marketing_sm.presentation.server import run_server
+
+settings = get_settings()
 
 logger = logging.getLogger()
 
 MAX_COLORS = 6
 MAX_POSTS = 12
+SCRAPE_JOB = "scrape_instagram"
 
 
 class Interface:
@@ -61,6 +80,7 @@ class Interface:
         self._output_textbox = None
         self._generate_button = None
         self._sell_posts_input = None
+        self._fresh_posts_input = None
         self._int_posts_input = None
         self._mot_posts_input = None
         self._edu_posts_input = None
@@ -72,8 +92,10 @@ class Interface:
         self._start_date_input = None
         self._description_choice = None
         self._save_new_profile = None
+        self._refresh_profile = None
         self._new_profile = None
         self._url_choice = None
+        self._scrape_status = None
         self._save_new_business = None
         self._new_business = None
         self._business_choice = None
@@ -92,10 +114,43 @@ class Interface:
         }
         self._months_dropdown = self.language.months
 
-        self.model = TextGenerationPipeline()
+        self._model = None
+        self._examples = None
+        self._clients_lock = threading.Lock()
+        self.jobs = JobQueue(
+            os.path.join(DATA_DIR, JOBS_DB_FILENAME),
+            handlers={SCRAPE_JOB: self._scrape_profile},
+            workers=settings.scrape_workers,
+        )
         self.business_options = self._business_options_orig
         self._update_business_options()
 
+    @property
+    def model(self):
+        with self._clients_lock:
+            if self._model is None:
+                from marketing_sm.business.ai import TextGenerationPipeline
+
+                self._model = TextGenerationPipeline()
+            return self._model
+
+    @property
+    def examples(self):
+        with self._clients_lock:
+            if self._examples is None:
+                from marketing_sm.data.examples import ExamplesIndex
+
+                self._examples = ExamplesIndex()
+            return self._examples
+
+    def warm_up(self):
+        with metrics.timed("warm_up"):
+            self.model
+            self.examples
+
+    def _start_warm_up(self):
+        threading.Thread(target=self.warm_up, name="warm-up", daemon=True).start()
+
     # BUSINESS NAME
     def new_business_change(self, option):
         new_business = option == self.language.add_new_brand_label
@@ -103,6 +158,9 @@ class Interface:
         description_options = self.descriptions_orig.copy()
         number_colors = 0
         color_updates = [self._gr.update(visible=True)] + [self._gr.update(visible=False) for _ in range(MAX_COLORS-1)]
+        if not new_business:
+            # Other replicas may have changed the business since it was loaded
+            self.state.refresh(option)
         if not new_business and option in self.state.businesses.keys():
             business = self.state.businesses[option]
             url_options.update(business.instagram_urls)
@@ -125,7 +183,7 @@ class Interface:
 
     def save_new_business(self, business_name: str):
         if business_name not in self.business_options:
-            self.state.businesses[business_name] = Business(business_name)
+            self.state.add_business(business_name)
             self._update_business_options()
         return (
             self._gr.update(choices=self.business_options),
@@ -137,7 +195,6 @@ class Interface:
         self.business_options = (
             list(self.state.businesses.keys()) + self._business_options_orig
         )
-        self.state.store_state()
 
     # DESCRIPTIONS
     def new_description_change(self, business, option):
@@ -162,13 +219,13 @@ class Interface:
 
     def save_new_description(self, business, title, description):
         options = self.descriptions_orig.copy()
-        if (
-            business in self.state.businesses.keys()
-            and title not in self.state.businesses[business].descriptions.keys()
-        ):
-            self.state.businesses[business].add_description(title, description)
-            options.update(self.state.businesses[business].descriptions)
-            self.state.store_state()
+        with self.state.lock(business):
+            if (
+                business in self.state.businesses.keys()
+                and title not in self.state.businesses[business].descriptions.keys()
+            ):
+                self.state.add_description(business, title, description)
+                options.update(self.state.businesses[business].descriptions)
         return (
             self._gr.update(choices=options.keys()),
             self._gr.update(visible=True, interactive=False, value=""),
@@ -179,26 +236,74 @@ class Interface:
     # URLs
     def new_url_change(self, option):
         visible = option == self.language.add_new_profile_label
-        return self._gr.update(visible=visible), self._gr.update(visible=visible)
+        return (
+            self._gr.update(visible=visible),
+            self._gr.update(visible=visible),
+            self._gr.update(visible=bool(option) and not visible),
+        )
 
-    def add_new_profile(self, business, url):
+    def add_new_profile(self, business, url, start_date):
         options = self.url_options_orig.copy()
-        if (
-            business in self.state.businesses.keys()
-            and url not in self.state.businesses[business].instagram_urls.keys()
-        ):
-            scraped_data = scrape_instagram(url)
-            self.state.businesses[business].instagram_urls[url] = Description(
-                url, scraped_data
-            )
+        if business in self.state.businesses.keys():
+            if url not in self.state.businesses[business].instagram_urls.keys():
+                since = str(start_date)[:10] if start_date else None
+                self._submit_scrape(business, url, since)
             options.update(self.state.businesses[business].instagram_urls)
-            self.state.store_state()
         return (
             self._gr.update(choices=options.keys()),
             self._gr.update(visible=False),
             self._gr.update(visible=False),
+            self._scrape_jobs_status(business),
+        )
+
+    def refresh_profile(self, business, url):
+        if (
+            business in self.state.businesses.keys()
+            and url in self.state.businesses[business].instagram_urls.keys()
+        ):
+            self._submit_scrape(business, url, None)
+        return self._scrape_jobs_status(business)
+
+    def _submit_scrape(self, business, url, since):
+        payload = {"business": business, "url": url, "since": since}
+        self.jobs.submit(SCRAPE_JOB, payload, unique=True)
+
+    def _scrape_profile(self, payload):
+        business, url = payload["business"], payload["url"]
+        profiles = self.state.businesses[business].instagram_urls
+        stored_posts = profiles[url].description if url in profiles else ScrapedProfile()
+        since = latest_post_date(stored_posts) or payload.get("since")
+        scraped_data = scrape_instagram(url, since=since)
+        logger.info(f"Scraped {len(scraped_data)} posts from {url} newer than {since}")
+        with self.state.lock(business):
+            # The profile may have been refreshed by another job while scraping
+            profiles = self.state.businesses[business].instagram_urls
+            stored_posts = profiles[url].description if url in profiles else ScrapedProfile()
+            merged_posts = merge_posts(stored_posts, scraped_data)
+            self.state.add_instagram(business, url, merged_posts)
+        self.examples.index_profile(business, url, scraped_data)
+        # The stored posts may have never been indexed, e.g. when the profile was imported
+        self.examples.index_profile(business, url, merged_posts, skip_indexed=True)
+
+    def _scrape_jobs_status(self, business):
+        jobs = self.jobs.jobs(SCRAPE_JOB, business=business)
+        lines = [
+            self.language.scrape_job_line.format(
+                job["payload"]["url"], self.language.job_statuses[job["status"]]
+            )
+            for job in jobs
+        ]
+        return self._gr.update(
+            visible=bool(lines),
+            value="\n".join([self.language.scrape_jobs_title] + lines),
         )
 
+    def _poll_scrape_jobs(self, business):
+        options = self.url_options_orig.copy()
+        if business in self.state.businesses.keys():
+            options.update(self.state.businesses[business].instagram_urls)
+        return self._gr.update(choices=options.keys()), self._scrape_jobs_status(business)
+
     def _create_posts(
         self,
         business,
@@ -211,20 +316,36 @@ class Interface:
         mot_posts,
         int_posts,
         sell_posts,
+        fresh_posts,
         *colors,
     ):
+        start = time.perf_counter()
         found = False
         business_examples = ""
         if business in self.state.businesses.keys():
-            self.state.businesses[business].save_colors(list(colors))
-            self.state.store_state()
+            self.state.save_colors(business, list(colors))
             if (
                 business_url_title
                 in self.state.businesses[business].instagram_urls.keys()
             ):
-                business_examples = self.state.businesses[business].instagram_urls[
+                scraped_posts = self.state.businesses[business].instagram_urls[
                     business_url_title
-                ]
+                ].description
+                try:
+                    with metrics.timed("retrieve_examples"):
+                        business_examples = self.examples.relevant_examples(
+                            business,
+                            business_url_title,
+                            scraped_posts,
+                            query=f"{month} {suggestions} {business_description}",
+                            top_k=settings.examples_top_k,
+                        )
+                except Exception:
+                    # The examples are then truncated to the token budget in the order of the profile, newest first
+                    logger.exception(
+                        f"Failed to retrieve the examples of {business_url_title}, using the scraped posts instead"
+                    )
+                    business_examples = scraped_posts.to_dicts()
                 found = True
         if not found:
             logger.warning(
@@ -233,7 +354,9 @@ class Interface:
 
         visible_colors = [color for color in colors if color is not None]
 
-        results = self.model.create_posts(
+        posts = []
+        shown = {}
+        posts_stream = self.model.iter_posts(
             business=business,
             business_examples=business_examples,
             business_description=business_description,
@@ -245,25 +368,52 @@ class Interface:
             int_posts=int_posts,
             sell_posts=sell_posts,
             colors=visible_colors,
+            use_cache=not fresh_posts,
         )
-        num_posts = len(results["posts"])
+        try:
+            for post, image_futures in posts_stream:
+                posts.append((post, image_futures))
+                if len(posts) == 1:
+                    metrics.observe("first_post_update", time.perf_counter() - start)
+                yield self._post_updates(posts, shown)
+                if len(posts) == MAX_POSTS:
+                    # Only MAX_POSTS posts can be shown: stop the generation before the images of more are requested
+                    break
+        finally:
+            posts_stream.close()
+
+        pending = [future for _, image_futures in posts for future in image_futures]
+        yield self._post_updates(posts, shown)
+        for _ in as_completed(pending):
+            yield self._post_updates(posts, shown)
+        metrics.observe("create_posts", time.perf_counter() - start)
+
+    def _post_updates(self, posts, shown):
+        # Posts whose images did not change since the previous update are left untouched
         updates = []
-        for idx_post in range(num_posts):
+        for idx_post, (post, image_futures) in enumerate(posts):
+            done = [future.done() for future in image_futures]
+            if shown.get(idx_post) == done:
+                updates += [self._gr.update(), self._gr.update(), self._gr.update()]
+                continue
+            shown[idx_post] = done
+
             text = self.language.post_text.format(
-                results["posts"][idx_post]["post_caption"],
-                results["posts"][idx_post]["prompt_image"],
+                post.get("post_caption", ""),
+                post["prompt_image"],
             )
-
+            captions = post["caption_image"]
             images = [
-                (image, results["posts"][idx_post]["caption_image"][idx])
-                for idx, image in enumerate(results["posts"][idx_post]["images"])
+                (future.result().thumbnail, captions[idx] if idx < len(captions) else "")
+                for idx, future in enumerate(image_futures)
+                if future.done() and future.result() is not None
             ]
             updates += [
                 self._gr.update(visible=True),
                 self._gr.update(visible=True, value=text),
                 self._gr.update(visible=True, value=images),
             ]
-        for idx_post in range(MAX_POSTS - num_posts):
+        for idx_post in range(MAX_POSTS - len(posts)):
             updates += [
                 self._gr.update(visible=False),
                 self._gr.update(visible=False, value=None),
@@ -272,6 +422,7 @@ class Interface:
         return updates
 
     def _refresh_app(self):
+        self.state.refresh()
         self._update_business_options()
         return self._gr.update(choices=self.business_options)
 
@@ -374,9 +525,13 @@ class Interface:
                 self._save_new_profile = self._gr.Button(
                     self.language.scrape_instagram_button, visible=False
                 )
+                self._refresh_profile = self._gr.Button(
+                    self.language.refresh_profile_button, visible=False
+                )
                 self._start_date_input = Calendar(
                     label=self.language.init_date_scrape_label
                 )
+                self._scrape_status = self._gr.Markdown(visible=False)
 
                 self._description_choice = self._gr.Dropdown(
                     label=self.language.page_description_label,
@@ -426,6 +581,9 @@ class Interface:
                 self._sell_posts_input = self._gr.Slider(
                     0, MAX_POSTS, step=1, label=self.language.selling_posts_label
                 )
+                self._fresh_posts_input = self._gr.Checkbox(
+                    label=self.language.fresh_posts_label, value=False
+                )
 
             self._generate_button = self._gr.Button(self.language.posts_generate_button)
 
@@ -506,15 +664,31 @@ class Interface:
             )
 
             # URL
+            self._demo.load(
+                self._poll_scrape_jobs,
+                inputs=[self._business_choice],
+                outputs=[self._url_choice, self._scrape_status],
+                every=settings.jobs_poll_seconds,
+            )
             self._url_choice.change(
                 self.new_url_change,
                 inputs=self._url_choice,
-                outputs=[self._new_profile, self._save_new_profile],
+                outputs=[self._new_profile, self._save_new_profile, self._refresh_profile],
+            )
+            self._refresh_profile.click(
+                self.refresh_profile,
+                inputs=[self._business_choice, self._url_choice],
+                outputs=[self._scrape_status],
             )
             self._save_new_profile.click(
                 self.add_new_profile,
-                inputs=[self._business_choice, self._new_profile],
-                outputs=[self._url_choice, self._new_profile, self._save_new_profile],
+                inputs=[self._business_choice, self._new_profile, self._start_date_input],
+                outputs=[
+                    self._url_choice,
+                    self._new_profile,
+                    self._save_new_profile,
+                    self._scrape_status,
+                ],
             )
 
             # NUMBER POSTS
@@ -588,6 +762,7 @@ class Interface:
                     self._mot_posts_input,
                     self._int_posts_input,
                     self._sell_posts_input,
+                    self._fresh_posts_input,
                     *self._colors,
                 ],
                 outputs=self._posts,
@@ -597,5 +772,15 @@ class Interface:
                 self._refresh_app, outputs=[self._business_choice]
             )
 
+            self._demo.queue(default_concurrency_limit=settings.ui_concurrency)
+
             logger.info("Launching the demo...")
-            self._demo.launch(server_name="0.0.0.0", server_port=8000, debug=True)
+            run_server(
+                self._demo,
+                host=settings.server_host,
+                port=settings.server_port,
+                on_startup=[self._start_warm_up],
+                on_shutdown=[self.state.store.close] if self.state.store is not None else [],
+                # Only the thumbnails are served, the rest of DATA_DIR holds the state and the caches
+                allowed_paths=[os.path.join(DATA_DIR, THUMBNAIL_CACHE_DIR)],
+            )
@@ -6,7 +6,7 @@ The `LanguageFactory` class serves as an abstract base class for creating langua
 """
 
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Dict, List
 
 
 class LanguageFactory(ABC):
@@ -190,9 +190,59 @@ class LanguageFactory(ABC):
     def post_images_label(self) -> str:
         pass
 
+    @property
+    @abstractmethod
+    def fresh_posts_label(self) -> str:
+        pass
+
+    @property
+    @abstractmethod
+    def scrape_jobs_title(self) -> str:
+        pass
+
+    @property
+    @abstractmethod
+    def scrape_job_line(self) -> str:
+        pass
+
+    @property
+    @abstractmethod
+    def job_statuses(self) -> Dict[str, str]:
+        pass
+
+    @property
+    @abstractmethod
+    def refresh_profile_button(self) -> str:
+        pass
+
 
 class PortugueseLanguage(LanguageFactory):
 
+    @property
+    def refresh_profile_button(self) -> str:
+        return "Atualizar Perfil de Instagram"
+
+    @property
+    def job_statuses(self) -> Dict[str, str]:
+        return {
+            "queued": "⏳ Em espera",
+            "running": "🔄 A ler",
+            "done": "✅ Concluído",
+            "failed": "❌ Falhou",
+        }
+
+    @property
+    def scrape_job_line(self) -> str:
+        return "- {}: {}"
+
+    @property
+    def scrape_jobs_title(self) -> str:
+        return "**Leitura de Perfis de Instagram**"
+
+    @property
+    def fresh_posts_label(self) -> str:
+        return "Gerar Conteúdo Novo (ignorar resultados guardados)"
+
     @property
     def post_images_label(self) -> str:
         return "Imagens"
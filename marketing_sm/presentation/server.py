@@ -0,0 +1,57 @@
+"""
+This module serves the Gradio interface from a FastAPI application, so that other endpoints can be exposed on the same
+port as the user interface:
+
+- `/metrics`: the metrics of `marketing_sm.infrastructure.metrics`, in the Prometheus text exposition format.
+
+Files served by Gradio under `/file=` (such as the images of the galleries) are content-addressed, so they are sent
+with long-lived `Cache-Control` headers and browsers do not request them again.
+
+The `on_startup` callbacks are run once the server has started, and the `on_shutdown` callbacks when it stops.
+"""
+
+from typing import Callable, Iterable, List, Optional
+
+import gradio as gr
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+from marketing_sm.infrastructure.metrics import REGISTRY
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+FILES_PATH_PREFIX = "/file="
+FILES_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def create_app(
+    demo,
+    on_startup: Iterable[Callable[[], None]] = (),
+    allowed_paths: Optional[List[str]] = None,
+    on_shutdown: Iterable[Callable[[], None]] = (),
+) -> FastAPI:
+    app = FastAPI(on_startup=list(on_startup), on_shutdown=list(on_shutdown))
+
+    @app.get("/metrics")
+    def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    @app.middleware("http")
+    async def cache_files(request: Request, call_next):
+        response = await call_next(request)
+        if request.url.path.startswith(FILES_PATH_PREFIX) and response.status_code == 200:
+            response.headers["Cache-Control"] = FILES_CACHE_CONTROL
+        return response
+
+    return gr.mount_gradio_app(app, demo, path="/", allowed_paths=allowed_paths)
+
+
+def run_server(
+    demo,
+    host: str,
+    port: int,
+    on_startup: Iterable[Callable[[], None]] = (),
+    allowed_paths: Optional[List[str]] = None,
+    on_shutdown: Iterable[Callable[[], None]] = (),
+):
+    uvicorn.run(create_app(demo, on_startup, allowed_paths, on_shutdown), host=host, port=port)
@@ -0,0 +1,43 @@
+import os
+import uuid
+
+import psycopg2
+import pytest
+from psycopg2.extensions import make_dsn
+
+from marketing_sm.data.storage import JournalStateStore, PostgresStateStore, SQLiteStateStore
+
+
+@pytest.fixture
+def postgres_dsn():
+    # Every test gets its own schema, dropped afterwards, so the tables of the database are never touched
+    dsn = os.environ.get("POSTGRES_DSN")
+    if not dsn:
+        pytest.skip("POSTGRES_DSN is not set")
+    try:
+        connection = psycopg2.connect(dsn, connect_timeout=3)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+    schema = f"test_{uuid.uuid4().hex}"
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA {schema}")
+    try:
+        yield make_dsn(dsn, options=f"-csearch_path={schema}")
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+        connection.close()
+
+
+@pytest.fixture(params=["sqlite", "journal", "postgres"])
+def open_store(request, tmp_path):
+    """Returns a function opening a state store of every backend, on the same data every time it is called."""
+    if request.param == "sqlite":
+        return lambda: SQLiteStateStore(os.path.join(tmp_path, "state.db"))
+    if request.param == "journal":
+        return lambda: JournalStateStore(
+            os.path.join(tmp_path, "state.json"), os.path.join(tmp_path, "state.journal"), compact_every=100
+        )
+    dsn = request.getfixturevalue("postgres_dsn")
+    return lambda: PostgresStateStore(dsn, 1, 2)
@@ -0,0 +1,52 @@
+import pytest
+from pydantic import ValidationError
+
+from marketing_sm.business.ai import fan_out_periods, plan_fan_out
+from marketing_sm.infrastructure.settings import Settings
+
+COUNTS = {"edu_posts": 7, "int_posts": 0, "sell_posts": 2, "mot_posts": 3}
+
+
+def test_plan_fan_out_splits_every_category_evenly():
+    parts = plan_fan_out(COUNTS, 3)
+
+    assert parts == [
+        {"edu_posts": 3, "int_posts": 0, "sell_posts": 0, "mot_posts": 0},
+        {"edu_posts": 2, "int_posts": 0, "sell_posts": 0, "mot_posts": 0},
+        {"edu_posts": 2, "int_posts": 0, "sell_posts": 0, "mot_posts": 0},
+        {"edu_posts": 0, "int_posts": 0, "sell_posts": 2, "mot_posts": 0},
+        {"edu_posts": 0, "int_posts": 0, "sell_posts": 0, "mot_posts": 3},
+    ]
+    assert all(sum(part.values()) <= 3 for part in parts)
+
+
+def test_plan_fan_out_without_posts_keeps_a_single_request():
+    counts = dict.fromkeys(COUNTS, 0)
+
+    assert plan_fan_out(counts, 3) == [counts]
+
+
+@pytest.mark.parametrize("posts_per_request", [0, -1])
+def test_plan_fan_out_rejects_empty_requests(posts_per_request):
+    with pytest.raises(ValueError):
+        plan_fan_out(COUNTS, posts_per_request)
+    with pytest.raises(ValidationError):
+        Settings(text_fan_out_posts=posts_per_request)
+
+
+def test_fan_out_periods_are_disjoint_within_a_category():
+    periods = fan_out_periods(plan_fan_out(COUNTS, 3))
+
+    assert periods == [
+        "days 1 to 10",
+        "days 11 to 20",
+        "days 21 to the end of the month",
+        "the whole month",
+        "the whole month",
+    ]
+
+
+def test_fan_out_periods_of_two_parts():
+    parts = plan_fan_out({"edu_posts": 4, "mot_posts": 0}, 2)
+
+    assert fan_out_periods(parts) == ["days 1 to 15", "days 16 to the end of the month"]
@@ -0,0 +1,20 @@
+import os
+
+from marketing_sm.presentation.batch import campaign_directory, slugify
+
+
+def test_similar_names_get_distinct_directories():
+    names = ["Loja A", "loja-a", "Loja  A!", "LOJA A"]
+
+    assert len({slugify(name) for name in names}) == len(names)
+    assert all(slugify(name).startswith("loja-a-") for name in names)
+    assert slugify("Loja A") == slugify("Loja A")
+    assert slugify("!!!").startswith("unnamed-")
+
+
+def test_campaign_directory():
+    directory = campaign_directory("campaigns", "Café São João", "Março")
+
+    business, month = directory.split(os.sep)[1:]
+    assert business.startswith("café-são-joão-")
+    assert month.startswith("março-")
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from marketing_sm.data.cache import DiskCache
+
+
+def cache_files(directory):
+    return sorted(name for _, _, files in os.walk(directory) for name in files)
+
+
+def test_keys_are_derived_from_the_content_of_their_inputs(tmp_path):
+    key = DiskCache.make_key("model", {"temperature": 1, "top_p": 0.95}, "message")
+
+    assert key == DiskCache.make_key("model", {"top_p": 0.95, "temperature": 1}, "message")
+    assert key != DiskCache.make_key("model", {"temperature": 1, "top_p": 0.95}, "other message")
+    assert len(key) == 64
+
+    cache = DiskCache(str(tmp_path), 1024, suffix=".txt")
+    path = cache.put(key, b"response")
+    assert path == os.path.join(str(tmp_path), key[:2], key + ".txt")
+    assert cache.get(key) == b"response"
+    assert cache.get(DiskCache.make_key("other")) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "bytes": 8}
+
+    # The entries are found again after a restart
+    assert DiskCache(str(tmp_path), 1024, suffix=".txt").get(key) == b"response"
+
+
+def test_failed_put_leaves_no_temporary_file(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), 1024)
+    key = DiskCache.make_key("prompt")
+
+    def replace(source, destination):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "replace", replace)
+    with pytest.raises(OSError):
+        cache.put(key, b"image")
+
+    assert cache_files(tmp_path) == []
+    assert cache.get(key) is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_entries_older_than_the_ttl_are_misses(tmp_path):
+    cache = DiskCache(str(tmp_path), 1024, ttl=60)
+    fresh, stale = DiskCache.make_key("fresh"), DiskCache.make_key("stale")
+    cache.put(fresh, b"fresh")
+    stale_path = cache.put(stale, b"stale")
+    # The entry was written two minutes ago, even if it was read since
+    written_at = os.path.getmtime(stale_path) - 120
+    os.utime(stale_path, (written_at + 100, written_at))
+
+    assert cache.get(fresh) == b"fresh"
+    assert cache.get(stale) is None
+    assert not os.path.exists(stale_path)
+    assert cache.stats()["entries"] == 1
+
+
+def test_reads_refresh_the_access_time_but_not_the_write_time(tmp_path):
+    cache = DiskCache(str(tmp_path), 1024, ttl=60)
+    key = DiskCache.make_key("prompt")
+    path = cache.put(key, b"data")
+    written_at = os.path.getmtime(path) - 10
+    os.utime(path, (written_at - 1000, written_at))
+
+    assert cache.get_path(key) == path
+
+    assert os.stat(path).st_atime > written_at
+    assert os.stat(path).st_mtime == written_at
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    cache = DiskCache(str(tmp_path), 10)
+    keys = [DiskCache.make_key(idx) for idx in range(3)]
+    for key in keys[:2]:
+        cache.put(key, b"12345")
+    cache.get(keys[0])
+
+    cache.put(keys[2], b"12345")
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == cache.get(keys[2]) == b"12345"
+    assert cache.stats()["bytes"] == 10
+
+
+def test_the_access_order_is_rebuilt_from_the_access_times(tmp_path):
+    cache = DiskCache(str(tmp_path), 10)
+    keys = [DiskCache.make_key(idx) for idx in range(3)]
+    paths = [cache.put(key, b"12345") for key in keys[:2]]
+    # The first entry was read more recently than the second one, before a restart
+    now = os.path.getmtime(paths[0])
+    os.utime(paths[0], (now, now - 10))
+    os.utime(paths[1], (now - 5, now - 5))
+
+    cache = DiskCache(str(tmp_path), 10)
+    cache.put(keys[2], b"12345")
+
+    assert not os.path.exists(paths[1])
+    assert os.path.exists(paths[0])
@@ -0,0 +1,25 @@
+import json
+
+from marketing_sm.business.compaction import compact_examples, estimate_tokens
+
+EXAMPLES = [
+    {"caption": "Mais relevante", "likesCount": 1, "images": ["https://example.com/1.jpg"]},
+    {"caption": "Mais popular", "likesCount": 1000, "commentsCount": 50, "hashtags": ["Promo", "promo"]},
+    {"caption": "Menos relevante", "likesCount": 10, "date": "2024-07-01T10:00:00.000Z"},
+]
+
+
+def test_examples_keep_the_given_order():
+    lines = compact_examples(EXAMPLES, 1000).splitlines()
+
+    assert [json.loads(line)["caption"] for line in lines] == ["Mais relevante", "Mais popular", "Menos relevante"]
+    assert json.loads(lines[0]) == {"caption": "Mais relevante", "likesCount": 1}
+    assert json.loads(lines[1])["hashtags"] == ["promo"]
+    assert json.loads(lines[2])["date"] == "2024-07-01"
+
+
+def test_examples_are_truncated_to_the_token_budget():
+    budget = estimate_tokens(compact_examples(EXAMPLES[:1], 1000))
+
+    assert compact_examples(EXAMPLES, budget) == compact_examples(EXAMPLES[:1], 1000)
+    assert compact_examples("Exemplos", 10) == "Exemplos"
@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+import time
+
+from marketing_sm.business.jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_jobs_are_run_by_the_workers(tmp_path):
+    ran = []
+
+    def scrape(payload):
+        if payload["url"] == "broken":
+            raise ValueError("Profile not found")
+        ran.append(payload["url"])
+
+    jobs = JobQueue(str(tmp_path / "jobs.db"), {"scrape": scrape}, workers=2, poll_interval=0.01)
+    first = jobs.submit("scrape", {"business": "Loja", "url": "loja"})
+    second = jobs.submit("scrape", {"business": "Loja", "url": "broken"})
+
+    wait_for(lambda: all(job["status"] in (DONE, FAILED) for job in jobs.jobs("scrape")))
+    statuses = {job["id"]: (job["status"], job["error"]) for job in jobs.jobs("scrape")}
+    assert statuses == {first: (DONE, None), second: (FAILED, "Profile not found")}
+    assert ran == ["loja"]
+
+
+def test_unique_jobs_are_only_queued_once(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"), {}, workers=0)
+    payload = {"business": "Loja", "url": "loja", "since": None}
+    ids = []
+
+    def submit():
+        ids.append(jobs.submit("scrape", payload, unique=True))
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(ids)) == 1
+    assert len(jobs.jobs("scrape")) == 1
+    # Without unique, or for another payload, a new job is queued
+    assert jobs.submit("scrape", payload) != ids[0]
+    assert jobs.submit("scrape", dict(payload, url="outra"), unique=True) != ids[0]
+    assert len(jobs.jobs("scrape")) == 3
+
+
+def test_jobs_are_filtered_by_payload(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"), {}, workers=0)
+    for idx in range(30):
+        jobs.submit("scrape", {"business": f"Loja {idx % 3}", "url": f"url-{idx}"})
+    jobs.submit("other", {"business": "Loja 1"})
+
+    found = jobs.jobs("scrape", business="Loja 1")
+
+    # The latest jobs of the business, even if other businesses have more recent ones
+    assert [job["payload"]["url"] for job in found] == [f"url-{idx}" for idx in range(28, 0, -3)]
+    assert jobs.jobs("scrape", limit=2, business="Loja 1", url="url-4")[0]["payload"]["url"] == "url-4"
+    assert jobs.jobs(business="Loja 1", limit=1)[0]["kind"] == "other"
+
+
+def test_running_jobs_are_queued_again_on_start_up(tmp_path):
+    filepath = str(tmp_path / "jobs.db")
+    jobs = JobQueue(filepath, {}, workers=0)
+    interrupted = jobs.submit("scrape", {"url": "interrupted"})
+    finished = jobs.submit("scrape", {"url": "finished"})
+    # The application stopped while the first job was running
+    with sqlite3.connect(filepath) as connection:
+        connection.execute("UPDATE jobs SET status = ? WHERE id = ?", (RUNNING, interrupted))
+        connection.execute("UPDATE jobs SET status = ? WHERE id = ?", (DONE, finished))
+
+    statuses = {job["id"]: job["status"] for job in JobQueue(filepath, {}, workers=0).jobs()}
+    assert statuses == {interrupted: QUEUED, finished: DONE}
+
+    ran = []
+    JobQueue(filepath, {"scrape": ran.append}, workers=1, poll_interval=0.01)
+    wait_for(lambda: ran)
+    assert ran == [{"url": "interrupted"}]
@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+
+from marketing_sm.business import model
+from marketing_sm.data.storage import CoalescingStateStore, StateStore, StateWriteError
+
+BUSINESSES = [f"Loja {idx}" for idx in range(4)]
+THREADS = 8
+DESCRIPTIONS_PER_THREAD = 25
+
+
+@pytest.fixture
+def state_settings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(model.settings, "state_backend", "sqlite")
+    monkeypatch.setattr(model.settings, "state_max_resident_businesses", 1)
+    monkeypatch.setattr(model.settings, "state_write_delay_seconds", 0.001)
+    return model.settings
+
+
+def test_concurrent_mutations_survive_eviction_and_reload(state_settings):
+    state = model.load_state()
+    for name in BUSINESSES:
+        state.add_business(name)
+
+    def add_descriptions(thread):
+        for idx in range(DESCRIPTIONS_PER_THREAD):
+            business = BUSINESSES[(thread + idx) % len(BUSINESSES)]
+            state.add_description(business, f"{thread}-{idx}", f"Descrição {thread}-{idx}")
+            state.save_colors(business, [f"#{thread:02d}{idx:04d}"])
+
+    threads = [threading.Thread(target=add_descriptions, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # With a single resident business, every mutation above raced with the eviction of its business
+    assert sum(len(state.businesses[name].descriptions) for name in BUSINESSES) == THREADS * DESCRIPTIONS_PER_THREAD
+    colors = {name: state.businesses[name].colors for name in BUSINESSES}
+    state.store.close()
+
+    reloaded = model.load_state()
+    assert list(reloaded.businesses) == BUSINESSES
+    descriptions = {
+        title
+        for name in BUSINESSES
+        for title in reloaded.businesses[name].descriptions
+    }
+    assert descriptions == {
+        f"{thread}-{idx}" for thread in range(THREADS) for idx in range(DESCRIPTIONS_PER_THREAD)
+    }
+    assert {name: reloaded.businesses[name].colors for name in BUSINESSES} == colors
+    reloaded.store.close()
+
+
+def test_add_business_is_idempotent(state_settings):
+    state = model.load_state()
+    business = state.add_business("Loja")
+    state.add_description("Loja", "default", "Uma loja")
+
+    assert state.add_business("Loja") is business
+    assert list(state.businesses["Loja"].descriptions) == ["default"]
+    state.store.close()
+
+
+class RecordingStore(StateStore):
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def load_business_names(self):
+        return []
+
+    def load_business(self, name):
+        return None
+
+    def save_business(self, name, colors):
+        raise AssertionError("Writes are saved in batches")
+
+    def save_entry(self, business, kind, title, value):
+        raise AssertionError("Writes are saved in batches")
+
+    def save_changes(self, businesses, entries):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("The database is down")
+        self.batches.append((businesses, entries))
+
+
+def test_coalescing_store_keeps_the_latest_value():
+    inner = RecordingStore()
+    store = CoalescingStateStore(inner, delay=0.05)
+    store.save_business("Loja", ["#000000"])
+    for idx in range(10):
+        store.save_entry("Loja", "descriptions", "default", f"Versão {idx}")
+    store.save_business("Loja", ["#ffffff"])
+    store.flush()
+
+    assert inner.batches == [({"Loja": ["#ffffff"]}, [("Loja", "descriptions", "default", "Versão 9")])]
+    assert store.coalesced == 10
+    store.close()
+
+
+def test_coalescing_store_retries_until_the_backend_recovers():
+    inner = RecordingStore(failures=3)
+    store = CoalescingStateStore(inner, delay=0.0, retry_delay=0.01, max_retry_delay=0.02)
+    store.save_business("Loja", ["#000000"])
+    store.save_entry("Loja", "descriptions", "default", "Uma loja")
+    store.save_entry("Loja", "suggestions", "first", "Primeira")
+
+    # Loads fail while the changes are not saved, instead of reading a stale state
+    with pytest.raises(StateWriteError):
+        store.load_business("Loja")
+    # A newer write replaces the failed one when it is queued again
+    store.save_entry("Loja", "descriptions", "default", "Outra loja")
+
+    while store.pending or inner.failures:
+        try:
+            store.flush()
+        except StateWriteError:
+            pass
+    store.flush()
+    saved = {}
+    for businesses, entries in inner.batches:
+        saved.update(businesses)
+        saved.update({entry[:3]: entry[3] for entry in entries})
+    assert saved == {
+        "Loja": ["#000000"],
+        ("Loja", "descriptions", "default"): "Outra loja",
+        ("Loja", "suggestions", "first"): "Primeira",
+    }
+    assert store.failures == 3
+    store.close()
+
+
+def test_coalescing_store_close_raises_for_unsaved_changes():
+    inner = RecordingStore(failures=100)
+    store = CoalescingStateStore(inner, delay=0.0, retry_delay=10.0)
+    store.save_entry("Loja", "descriptions", "default", "Uma loja")
+
+    with pytest.raises(StateWriteError):
+        store.close()
+    assert inner.batches == []
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from marketing_sm.data.parser import IncrementalPostsParser
+
+POSTS = [
+    {
+        "content_type": "image",
+        "caption_image": ["Promoção {de} [verão]"],
+        "post_caption": 'Diga "olá" \\ boas-vindas ☀️',
+        "prompt_image": ["A beach with \"blue\" and {yellow} tones"],
+    },
+    {
+        "content_type": "reel",
+        "caption_image": [],
+        "post_caption": "Sem imagens",
+        "prompt_image": [],
+    },
+]
+RESPONSE = "```json\n" + json.dumps({"posts": POSTS}, ensure_ascii=False) + "\n```"
+
+
+def feed_all(parser, chunks):
+    posts = []
+    for chunk in chunks:
+        posts += parser.feed(chunk)
+    return posts
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(RESPONSE)])
+def test_posts_are_parsed_across_any_chunk_boundary(size):
+    parser = IncrementalPostsParser()
+
+    posts = feed_all(parser, [RESPONSE[start: start + size] for start in range(0, len(RESPONSE), size)])
+
+    assert posts == POSTS
+    assert parser.posts_found == 2
+    assert parser.text == RESPONSE
+
+
+def test_posts_are_returned_as_soon_as_they_are_closed():
+    parser = IncrementalPostsParser()
+    first_end = RESPONSE.index('"content_type": "reel"')
+
+    assert parser.feed(RESPONSE[:first_end]) == POSTS[:1]
+    assert parser.feed(RESPONSE[first_end:]) == POSTS[1:]
+
+
+def test_preamble_with_brackets_and_quotes_is_ignored():
+    parser = IncrementalPostsParser()
+    preamble = 'Here are the "posts" [as requested]: '
+
+    assert feed_all(parser, [preamble[:20], preamble[20:] + RESPONSE]) == POSTS
+
+
+def test_malformed_and_invalid_posts_are_skipped():
+    parser = IncrementalPostsParser()
+    response = json.dumps({"posts": [POSTS[0], {"content_type": "image"}]})[:-2] + ', {"content_type": }]}'
+
+    assert feed_all(parser, [response]) == POSTS[:1]
+    assert parser.posts_found == 1
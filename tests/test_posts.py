@@ -0,0 +1,103 @@
+import pytest
+
+from marketing_sm.data.posts import ScrapedProfile
+
+LEGACY_POSTS = [
+    {
+        "caption": "Promoção de verão ☀️",
+        "alt": "Uma praia",
+        "commentsCount": 12,
+        "hashtags": ["verão", "promo"],
+        "images": ["https://example.com/1.jpg", "https://example.com/2.jpg"],
+        "likesCount": 340,
+        "date": "2024-07-01T10:00:00.000Z",
+    },
+    {
+        "caption": "Dica da semana",
+        "alt": "",
+        "commentsCount": "",
+        "hashtags": ["dicas", "promo"],
+        "images": [],
+        "likesCount": "",
+        "date": "2024-06-15T08:30:15.250Z",
+    },
+    {
+        "caption": "Sem data",
+        "alt": "",
+        "commentsCount": 1,
+        "hashtags": "",
+        "images": "",
+        "likesCount": 2,
+        "date": "",
+    },
+]
+
+
+def test_legacy_lists_are_converted():
+    profile = ScrapedProfile.from_value(LEGACY_POSTS)
+
+    assert len(profile) == 3
+    first, second, third = profile
+    assert first.caption == "Promoção de verão ☀️"
+    assert first.hashtags == ("verão", "promo")
+    assert first.images == ("https://example.com/1.jpg", "https://example.com/2.jpg")
+    assert (first.likes, first.comments) == (340, 12)
+    assert first.date == "2024-07-01T10:00:00.000Z"
+    assert (second.likes, second.comments) == (0, 0)
+    assert second.date == "2024-06-15T08:30:15.250Z"
+    assert (third.hashtags, third.images, third.date) == ((), (), "")
+    assert profile[-1].caption == "Sem data"
+    assert ScrapedProfile.from_value(profile) is profile
+
+
+def test_encode_decode_round_trip():
+    profile = ScrapedProfile.from_dicts(LEGACY_POSTS)
+
+    decoded = ScrapedProfile.decode(profile.encode())
+
+    assert decoded == profile
+    assert decoded.to_dicts() == profile.to_dicts()
+    assert ScrapedProfile.from_value(profile.encode()) == profile
+    # Hashtags are shared through the vocabulary of the profile
+    assert decoded[0].hashtags[1] is decoded[1].hashtags[1]
+
+
+def test_empty_profile_round_trip():
+    profile = ScrapedProfile()
+
+    decoded = ScrapedProfile.decode(profile.encode())
+
+    assert len(decoded) == 0
+    assert decoded.latest_date() is None
+    assert ScrapedProfile.from_value(None).to_dicts() == []
+
+
+def test_decode_rejects_other_data():
+    with pytest.raises(ValueError):
+        ScrapedProfile.decode(b'[{"caption": ""}]')
+
+
+def test_merge_keeps_the_newest_version_of_every_post():
+    stored = ScrapedProfile.from_dicts(LEGACY_POSTS[1:])
+    new = ScrapedProfile.from_dicts([LEGACY_POSTS[0], dict(LEGACY_POSTS[1], likesCount=99)])
+
+    merged = stored.merge(new)
+
+    assert [post.caption for post in merged] == ["Promoção de verão ☀️", "Dica da semana", "Sem data"]
+    assert merged[1].likes == 99
+    assert merged.latest_date() == "2024-07-01T10:00:00.000Z"
+
+
+def test_profiles_are_persisted(open_store):
+    profile = ScrapedProfile.from_dicts(LEGACY_POSTS)
+    store = open_store()
+    store.save_business("Loja", [])
+    store.save_entry("Loja", "instagram_urls", "https://instagram.com/loja", profile)
+    store.save_entry("Loja", "instagram_urls", "https://instagram.com/antiga", LEGACY_POSTS)
+    store.close()
+
+    store = open_store()
+    profiles = store.load_business("Loja")["instagram_urls"]
+    assert profiles["https://instagram.com/loja"]["description"] == profile
+    assert profiles["https://instagram.com/antiga"]["description"] == profile
+    store.close()
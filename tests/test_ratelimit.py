@@ -0,0 +1,120 @@
+import logging
+
+import pytest
+
+from marketing_sm.infrastructure import ratelimit
+from marketing_sm.infrastructure.ratelimit import AdaptiveLimiter, RateLimiter, RetryableError
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def test_limit_grows_additively_up_to_the_maximum(clock):
+    limiter = AdaptiveLimiter("test", max_concurrency=4)
+    limiter.limit = 2.0
+
+    for _ in range(2):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == pytest.approx(2.0 + 1 / 2 + 1 / 2.5)
+
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+    # Failures that are not throttling leave the limit unchanged
+    limiter.limit = 3.0
+    limiter.acquire()
+    limiter.release(success=False)
+    assert limiter.limit == 3.0
+
+
+def test_limit_decreases_once_per_round_down_to_the_minimum(clock, caplog):
+    limiter = AdaptiveLimiter("test", max_concurrency=8, min_concurrency=2)
+    started = [limiter.acquire() for _ in range(3)]
+
+    with caplog.at_level(logging.WARNING):
+        # The calls of the same round only decrease the limit once
+        for started_at in started:
+            clock.now += 1
+            limiter.throttle(started_at)
+        assert limiter.limit == 4
+        assert limiter.throttled == 3
+
+        for _ in range(3):
+            clock.now += 1
+            limiter.throttle(limiter.acquire())
+        assert limiter.limit == 2
+
+    # The limit only went down twice, the throttled calls at the minimum are not logged
+    assert [record.getMessage() for record in caplog.records] == [
+        "test is throttled, concurrency limit lowered to 4",
+        "test is throttled, concurrency limit lowered to 2",
+    ]
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.parametrize("attempt", range(8))
+def test_backoff_is_jittered_within_the_capped_exponential_bound(attempt):
+    limiter = AdaptiveLimiter("test", max_concurrency=1, base_delay=0.5, max_delay=10.0)
+
+    delays = [limiter.backoff(attempt) for _ in range(200)]
+
+    assert all(0 <= delay <= min(10.0, 0.5 * 2 ** attempt) for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_retry_after_is_used_up_to_the_maximum_delay(clock):
+    limiter = AdaptiveLimiter("test", max_concurrency=1, max_attempts=3, max_delay=10.0)
+
+    assert limiter.backoff(0, retry_after=3.0) == 3.0
+    assert limiter.backoff(0, retry_after=120.0) == 10.0
+    assert limiter.retry(0, RetryableError("429", retry_after=3.0))
+    assert limiter.retry(1, RetryableError("429", retry_after=30.0))
+    assert not limiter.retry(2, RetryableError("429"))
+    assert clock.slept == [3.0, 10.0]
+    assert limiter.retries == 2
+
+
+def test_throttled_calls_are_retried_until_they_succeed(clock):
+    limiter = AdaptiveLimiter("test", max_concurrency=4, max_attempts=3, base_delay=1.0)
+    calls = []
+
+    def call():
+        calls.append(clock.now)
+        if len(calls) < 3:
+            raise RetryableError("503")
+        return "done"
+
+    assert limiter.call(call) == "done"
+    assert len(calls) == 3
+    assert limiter.limit == pytest.approx(1 + 1 / 1)
+    assert limiter.in_flight == 0
+
+
+def test_rate_limiter_spaces_the_requests(clock):
+    limiter = RateLimiter.per_minute(30)
+
+    waits = [limiter.acquire() for _ in range(3)]
+
+    assert waits == [0.0, 2.0, 2.0]
+    assert clock.now == 1004.0
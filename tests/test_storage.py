@@ -0,0 +1,124 @@
+import json
+import os
+
+from marketing_sm.data.storage import JournalStateStore
+
+
+def journal_store(directory, compact_every=100):
+    return JournalStateStore(
+        os.path.join(directory, "state.json"),
+        os.path.join(directory, "state.journal"),
+        compact_every=compact_every,
+    )
+
+
+def test_journal_replays_mutations_after_restart(tmp_path):
+    store = journal_store(tmp_path)
+    store.save_business("Loja", ["#000000"])
+    store.save_entry("Loja", "descriptions", "default", "Uma loja")
+    # Simulate a crash: the journal is not compacted on close
+    store._journal.close()
+
+    store = journal_store(tmp_path)
+    business = store.load_business("Loja")
+    assert business["colors"] == ["#000000"]
+    assert business["descriptions"]["default"]["description"] == "Uma loja"
+    store.close()
+
+
+def test_journal_ignores_a_torn_last_line(tmp_path):
+    store = journal_store(tmp_path)
+    store.save_business("Loja", [])
+    store.save_entry("Loja", "descriptions", "first", "Primeira")
+    store._journal.close()
+
+    # The last mutation was only partially written when the process died
+    mutation = {"op": "entry", "business": "Loja", "kind": "descriptions", "title": "second", "value": "Segunda"}
+    with open(tmp_path / "state.journal", "a", encoding="utf-8") as f:
+        f.write(json.dumps(mutation)[:25])
+
+    store = journal_store(tmp_path)
+    descriptions = store.load_business("Loja")["descriptions"]
+    assert list(descriptions) == ["first"]
+    # The replayed mutations are compacted into the snapshot and the torn line dropped
+    assert os.path.getsize(tmp_path / "state.journal") == 0
+    store.save_entry("Loja", "descriptions", "third", "Terceira")
+    store.close()
+
+    store = journal_store(tmp_path)
+    assert list(store.load_business("Loja")["descriptions"]) == ["first", "third"]
+    store.close()
+
+
+def test_journal_compacts_into_the_snapshot(tmp_path):
+    store = journal_store(tmp_path, compact_every=3)
+    store.save_business("Loja", [])
+    for idx in range(4):
+        store.save_entry("Loja", "suggestions", f"s{idx}", f"Sugestão {idx}")
+
+    with open(tmp_path / "state.json", "r", encoding="utf-8") as f:
+        snapshot = json.load(f)["businesses"]
+    assert list(snapshot["Loja"]["suggestions"]) == ["s0", "s1"]
+    with open(tmp_path / "state.journal", "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    store.close()
+
+    store = journal_store(tmp_path)
+    assert list(store.load_business("Loja")["suggestions"]) == ["s0", "s1", "s2", "s3"]
+    store.close()
+
+
+def test_corrupted_snapshot_is_moved_aside(tmp_path):
+    with open(tmp_path / "state.json", "w", encoding="utf-8") as f:
+        f.write('{"businesses": {')
+
+    store = journal_store(tmp_path)
+    assert store.load_business_names() == []
+    assert any(name.startswith("state.json") and name != "state.json" for name in os.listdir(tmp_path))
+    store.close()
+
+
+def test_businesses_and_entries_are_loaded_back(open_store):
+    store = open_store()
+    store.save_business("Loja B", ["#000000"])
+    store.save_business("Loja A", [])
+    store.save_entry("Loja B", "descriptions", "default", "Uma loja")
+    store.save_entry("Loja B", "suggestions", "first", "Primeira")
+    store.close()
+
+    store = open_store()
+    assert store.load_business_names() == ["Loja B", "Loja A"]
+    business = store.load_business("Loja B")
+    assert business["colors"] == ["#000000"]
+    assert business["descriptions"] == {"default": {"title": "default", "description": "Uma loja"}}
+    assert list(business["suggestions"]) == ["first"]
+    assert store.load_business("Loja C") is None
+    store.close()
+
+
+def test_saved_changes_are_merged_into_the_stored_ones(open_store):
+    store = open_store()
+    store.save_business("Loja", ["#000000"])
+    store.save_entry("Loja", "descriptions", "first", "Primeira")
+    store.save_entry("Loja", "descriptions", "second", "Segunda")
+    store.save_changes(
+        {"Loja": ["#ffffff"], "Outra loja": []},
+        [
+            ("Loja", "descriptions", "first", "Primeira, revista"),
+            ("Loja", "descriptions", "third", "Terceira"),
+            ("Outra loja", "suggestions", "first", "Sugestão"),
+        ],
+    )
+    store.close()
+
+    store = open_store()
+    assert store.load_business_names() == ["Loja", "Outra loja"]
+    business = store.load_business("Loja")
+    assert business["colors"] == ["#ffffff"]
+    assert {title: entry["description"] for title, entry in business["descriptions"].items()} == {
+        "first": "Primeira, revista",
+        "second": "Segunda",
+        "third": "Terceira",
+    }
+    assert list(store.load_business("Outra loja")["suggestions"]) == ["first"]
+    store.close()
@@ -0,0 +1,32 @@
+import threading
+
+from marketing_sm.data.text import FakeTextBackend, LimitedTextBackend
+from marketing_sm.infrastructure import metrics
+from marketing_sm.infrastructure.ratelimit import AdaptiveLimiter
+
+
+def stage_seconds(stage):
+    observations = {}
+    for line in metrics.REGISTRY.render().splitlines():
+        if line.startswith("marketing_sm_stage_seconds_") and f'stage="{stage}"' in line:
+            name = line.split("{")[0].rsplit("_", 1)[1]
+            observations[name] = float(line.rsplit(" ", 1)[1])
+    return observations.get("sum", 0.0), observations.get("count", 0.0)
+
+
+def test_time_to_first_token_excludes_the_limiter_wait():
+    backend = LimitedTextBackend(FakeTextBackend(1000.0, 0.01, ""), AdaptiveLimiter("test", 1))
+    first = backend.stream("first", {})
+    next(first)
+    ttft_before, ttft_count_before = stage_seconds("time_to_first_token")
+    wait_before, _ = stage_seconds("text_limiter_wait")
+
+    # The second request waits for the slot of the first one, released 0.2 seconds later
+    threading.Timer(0.2, lambda: list(first)).start()
+    assert '"posts"' in "".join(backend.stream("second", {}))
+
+    ttft_after, ttft_count_after = stage_seconds("time_to_first_token")
+    wait_after, _ = stage_seconds("text_limiter_wait")
+    assert ttft_count_after == ttft_count_before + 1
+    assert ttft_after - ttft_before < 0.15
+    assert wait_after - wait_before >= 0.15